@@ -0,0 +1,277 @@
+# performance benchmarks, e.g.: python bench.py parallel --rows 1000000
+# these are not run as part of the tests because timings depend on the machine
+
+# to catch regressions, save a baseline before a change and compare against it afterwards:
+# python bench.py validators --save baseline.json
+# python bench.py validators --compare baseline.json
+
+import argparse
+import json
+import os
+import sys
+import time
+import timeit
+import tracemalloc
+
+import gae_validators
+from gae_validators import ONE_MB, batch, validateDateTime, validateEmail, validateText
+
+
+def _repeat(pattern, size):
+    return (pattern * (size // len(pattern) + 1))[:size]
+
+
+# (validator name, case name, source, kwargs) for every public validator
+# realistic form input first, then inputs that are large or target the slow paths of each validator
+VALIDATOR_CASES = (
+    ('validateString', 'short', u'Jane Doe', {}),
+    ('validateString', 'max length', _repeat(u'lorem ipsum ', 500), {}),
+    ('validateString', 'too long', _repeat(u'lorem ipsum ', 100000), {}),
+    ('validateString', 'space runs', _repeat(u'a' + u' ' * 50, 500), {}),
+    ('validateString', 'unicode spaces', _repeat(u'a\xa0\u3000 ', 500), {}),
+    ('validateString', 'bytes', _repeat(u'caf\xe9 ', 500).encode('utf-8'), {}),
+    ('validateRequiredString', 'short', u'Jane Doe', {}),
+    ('validateText', 'paragraph', _repeat(u'Lorem ipsum dolor sit amet.\n', 1000), {}),
+    ('validateText', '1 MB words', _repeat(u'lorem ipsum dolor sit amet ', ONE_MB), {}),
+    ('validateText', '1 MB accented', _repeat(u'lorem ipsum dolor sit am\xe9t ', ONE_MB), {}),
+    ('validateText', '1 MB double spaces', _repeat(u'a  ', ONE_MB), {}),
+    ('validateText', '1 MB growing spaces', _repeat(u''.join(u'a' + u' ' * i for i in range(64)), ONE_MB), {}),
+    ('validateText', '1 MB unicode spaces', _repeat(u'a\xa0', ONE_MB), {}),
+    ('validateRequiredText', 'paragraph', _repeat(u'Lorem ipsum dolor sit amet.\n', 1000), {}),
+    ('validateEmail', 'short', u'jane.doe@example.com', {}),
+    ('validateEmail', 'subdomains', u'jane@mail.eu.west.example.co.uk', {}),
+    ('validateEmail', 'idn', u'jane@b\xfccher.de', {}),
+    ('validateEmail', 'long labels', u'jane@' + u'.'.join([u'a' * 63] * 7) + u'.com', {}),
+    ('validateEmail', 'hyphen runs', u'jane@' + u'a-' * 240 + u'!', {}),
+    ('validateEmail', 'many dots', u'jane@' + u'a.' * 240, {}),
+    ('validateRequiredEmail', 'short', u'jane.doe@example.com', {}),
+    ('validatePhone', 'us', u'(555) 555-5555', {}),
+    ('validatePhone', 'international', u'+44 20 7946 0958', {}),
+    ('validatePhone', 'extension', u'+1 555-555-5555 ext. 12345', {'extension_separators': ('ext.', 'x')}),
+    ('validatePhone', 'long digits', _repeat(u'5', 500), {}),
+    ('validatePhone', 'long separators', _repeat(u'5 x ', 500), {'extension_separators': ('x',),
+        'extension_max_length': 50}),
+    ('validateRequiredPhone', 'us', u'(555) 555-5555', {}),
+    ('validateUrl', 'short', u'https://www.example.com/', {}),
+    ('validateUrl', 'full', u'https://www.example.com:8080/path/to/page?key=value&other=1#top', {}),
+    ('validateUrl', 'normalize', u'HTTPS://www.B\xfccher.de:443/path', {'normalize': True}),
+    ('validateUrl', 'hyphen runs', u'http://' + u'a-' * 240 + u'!', {}),
+    ('validateUrl', 'many dots', u'http://' + u'0.' * 240 + u'-', {}),
+    ('validateUrl', 'many colons', u'http://' + u'a:' * 240 + u'!', {}),
+    ('validateRequiredUrl', 'short', u'https://www.example.com/', {}),
+    ('validateUrlParts', 'full', u'https://www.example.com:8080/path/to/page?key=value&other=1#top', {}),
+    ('validateRequiredUrlParts', 'short', u'https://www.example.com/', {}),
+    ('validateChoices', 'list', u'green', {'choices': ['red', 'orange', 'yellow', 'green', 'blue']}),
+    ('validateChoices', 'large list', u'choice 9999', {'choices': ['choice %d' % i for i in range(10000)]}),
+    ('validateChoices', 'choice set', u'choice 9999',
+        {'choices': gae_validators.ChoiceSet('choice %d' % i for i in range(10000))}),
+    ('validateRequiredChoices', 'list', u'green', {'choices': ['red', 'orange', 'yellow', 'green', 'blue']}),
+    ('validateBool', 'short', u'on', {}),
+    ('validateInt', 'short', u'42', {}),
+    ('validateInt', 'too large', _repeat(u'9', 500), {}),
+    ('validateInt', 'not a number', u'forty two', {}),
+    ('validateRequiredInt', 'short', u'42', {}),
+    ('validateFloat', 'short', u'3.14159', {}),
+    ('validateFloat', 'exponent', u'1e308', {}),
+    ('validateFloat', 'too large', _repeat(u'9', 500), {}),
+    ('validateRequiredFloat', 'short', u'3.14159', {}),
+    ('validateDateTime', 'iso', u'2020-01-20T13:45', {}),
+    ('validateDateTime', 'future only', u'3000-01-20T13:45', {'future_only': True}),
+    ('validateDateTime', 'custom format', u'01/20/2020 1:45 PM', {'date_format': '%m/%d/%Y %I:%M %p'}),
+    ('validateDateTime', 'invalid', u'2020-13-45T99:99', {}),
+    ('validateDateTime', 'long garbage', _repeat(u'2020-', 500), {}),
+    ('validateRequiredDateTime', 'iso', u'2020-01-20T13:45', {}),
+    ('validateDate', 'iso', u'2020-01-20', {}),
+    ('validateRequiredDate', 'iso', u'2020-01-20', {}),
+    ('validateTime', 'short', u'13:45', {}),
+    ('validateRequiredTime', 'short', u'13:45', {})
+)
+
+# how much slower than the baseline a case has to be to count as a regression
+REGRESSION_THRESHOLD = 1.3
+
+
+def _rows(count):
+    emails = ['user%d@example%d.com' % (i, i % 100) for i in range(count)]
+    dates = ['20%02d-%02d-%02dT%02d:%02d' % (i % 100, i % 12 + 1, i % 28 + 1, i % 24, i % 60) for i in range(count)]
+    return emails, dates
+
+
+def benchParallel(options):
+    from gae_validators.parallel import validateParallel
+
+    emails, dates = _rows(options.rows)
+    max_workers = options.max_workers or os.cpu_count() or 1
+
+    for validator, sources in ((validateEmail, emails), (validateDateTime, dates)):
+        name = validator.__name__
+
+        start = time.time()
+        getattr(batch, name)(sources)
+        serial = time.time() - start
+        print('%s serial: %.2fs (%d/s)' % (name, serial, len(sources) / serial))
+
+        workers = 1
+        while True:
+            start = time.time()
+            validateParallel(validator, sources, chunk_size=options.chunk_size, max_workers=workers)
+            elapsed = time.time() - start
+            print('%s %d workers: %.2fs (%d/s, %.1fx serial)' % (name, workers, elapsed,
+                len(sources) / elapsed, serial / elapsed))
+
+            if workers >= max_workers:
+                break
+            workers = min(workers * 2, max_workers)
+
+
+def _measure(func, *args):
+    # returns the best time of a few runs and the peak memory allocated during one
+    elapsed = None
+    for _ in range(5):
+        start = time.time()
+        func(*args)
+        run = time.time() - start
+        elapsed = run if elapsed is None else min(elapsed, run)
+
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return elapsed, peak
+
+
+def benchText(options):
+    # large and adversarial inputs for the whitespace handling in validateString
+    inputs = (
+        ('words', u'lorem ipsum dolor sit amet '),
+        ('accented words', u'lorem ipsum dolor sit am\xe9t '),
+        ('long space runs', u'a' + u' ' * 1000),
+        ('double spaces', u'a  '),
+        ('growing space runs', u''.join(u'a' + u' ' * i for i in range(64))),
+        ('unicode spaces', u'a\xa0'),
+        ('mixed spaces', u'a\xa0 \u3000 b '),
+        ('only spaces', u' ')
+    )
+
+    for name, pattern in inputs:
+        source = (pattern * (ONE_MB // len(pattern) + 1))[:ONE_MB]
+        elapsed, peak = _measure(validateText, source)
+        print('%-20s %8.2fms %8.2fMB peak' % (name, elapsed * 1000, peak / float(ONE_MB)))
+
+
+def _calibrationWork():
+    # a fixed amount of pure Python work that doesn't touch any validator code
+    '-'.join(str(i) for i in range(100)).split('-')
+
+
+def _throughput(func, rounds=5):
+    # returns calls per second along with the cost relative to the calibration work
+    # the two are timed in alternating rounds, so the relative cost barely changes when the machine is busy
+    # or throttled, which makes it stable enough to compare against a baseline from another run (or machine)
+    # CPU time is used rather than wall time so that other processes make less of a difference too
+    timer = timeit.Timer(func, timer=time.process_time)
+    number = timer.autorange()[0]
+    calibration = timeit.Timer(_calibrationWork, timer=time.process_time)
+    calibration_number = calibration.autorange()[0]
+
+    best = None
+    costs = []
+    for _ in range(rounds):
+        elapsed = timer.timeit(number) / number
+        best = elapsed if best is None else min(best, elapsed)
+        costs.append(elapsed / (calibration.timeit(calibration_number) / calibration_number))
+
+    return 1 / best, sorted(costs)[rounds // 2]
+
+
+def _peakMemory(func):
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def _compare(results, baseline, threshold):
+    # returns the names of the cases that got slower or used more memory than the baseline allows
+    regressions = []
+    for name, result in sorted(results.items()):
+        previous = baseline.get(name)
+        if not previous:
+            continue
+
+        slower = result['relative_cost'] / previous['relative_cost']
+        # small allocations vary from run to run, so memory is only compared above a few KB
+        larger = result['peak_bytes'] / float(max(previous['peak_bytes'], 4096))
+        if slower > threshold or larger > threshold:
+            regressions.append(name)
+            print('REGRESSION %-45s %.2fx slower, %.2fx memory' % (name, slower, larger))
+
+    return regressions
+
+
+def benchValidators(options):
+    # throughput and peak memory of every validator on both realistic and adversarial inputs
+    results = {}
+
+    for validator_name, case_name, source, kwargs in VALIDATOR_CASES:
+        if options.filter and options.filter not in validator_name:
+            continue
+
+        validator = getattr(gae_validators, validator_name)
+
+        def call():
+            validator(source, **kwargs)
+
+        name = validator_name + ': ' + case_name
+        calls_per_second, relative_cost = _throughput(call)
+        peak = _peakMemory(call)
+        results[name] = {'calls_per_second': calls_per_second, 'relative_cost': relative_cost, 'peak_bytes': peak}
+        print('%-45s %12.0f/s %10.1fKB peak' % (name, calls_per_second, peak / 1024.0))
+
+    if options.save:
+        with open(options.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)
+
+        if _compare(results, baseline, options.threshold):
+            return 1
+
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run performance benchmarks.')
+    subparsers = parser.add_subparsers(dest='benchmark')
+
+    parallel_parser = subparsers.add_parser('parallel', help='scaling of parallel validation across processes')
+    parallel_parser.add_argument('--rows', type=int, default=1000000)
+    parallel_parser.add_argument('--chunk-size', type=int, default=10000)
+    parallel_parser.add_argument('--max-workers', type=int, default=None)
+    parallel_parser.set_defaults(func=benchParallel)
+
+    text_parser = subparsers.add_parser('text', help='time and peak memory of validateText on 1 MB inputs')
+    text_parser.set_defaults(func=benchText)
+
+    validators_parser = subparsers.add_parser('validators',
+        help='throughput and peak memory of every validator, optionally compared against a saved baseline')
+    validators_parser.add_argument('--filter', help='only run validators whose name contains this')
+    validators_parser.add_argument('--save', metavar='PATH', help='save the results as a JSON baseline')
+    validators_parser.add_argument('--compare', metavar='PATH',
+        help='compare against a saved baseline and exit with an error on any regression')
+    validators_parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+        help='how many times slower or larger a case can get before it counts as a regression')
+    validators_parser.set_defaults(func=benchValidators)
+
+    options = parser.parse_args()
+    if not getattr(options, 'func', None):
+        parser.error('choose a benchmark')
+    return options.func(options)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,21 +1,42 @@
+from collections import namedtuple
 from datetime import datetime
-import re
+import io
+import sys
+
+# to keep the import fast on cold starts, re, functools, and unicodedata are only imported once they're needed
 
 # python 3 support
-PY3 = False
-try:
-    unicode('')
-except NameError:
-    PY3 = True
+PY3 = sys.version_info[0] >= 3
+if PY3:
     unicode = str
 
+
+class _LazyRegex(object):
+    # WARNING: this is a private class for internal use only - do not use directly
+    # a regex that isn't compiled (or even imports re) until it's first used
+    # after that the compiled methods are copied onto the instance, so later calls don't go through __getattr__
+
+    def __init__(self, pattern):
+        self._pattern = pattern
+
+    def __getattr__(self, name):
+        # only called for attributes that aren't on the instance yet
+        if name.startswith('__') or name == '_pattern':
+            raise AttributeError(name)
+
+        import re
+        compiled = re.compile(self._pattern)
+        for method in ('match', 'search', 'sub', 'split', 'findall', 'finditer'):
+            setattr(self, method, getattr(compiled, method))
+
+        return getattr(compiled, name)
+
+
 ONE_MB = 2 ** 20
 INT_SIZE = 2 ** 63 # 63 bits plus 1 bit for sign = 64 bit signed integer
-EMAIL_USER = re.compile(r"^[^ \t\n\r@<>()]+$", re.I)
-EMAIL_DOMAIN = re.compile(r'''
-    ^(?:[a-z0-9][a-z0-9\-]{0,62}\.)+ # subdomain
-    [a-z]{2,}$                       # TLD
-''', re.I | re.VERBOSE)
+EMAIL_USER = _LazyRegex(r"(?i)^[^ \t\n\r@<>()]+$")
+# the characters allowed in each label of a domain name, though it can't start with a hyphen
+DOMAIN_LABEL_CHARS = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-'
 
 # this is a selective list that tries to encompass anything that actually renders as a space
 # that means zero-width spaces and visible characters are purposefully omitted
@@ -44,114 +65,402 @@ if PY3:
 else:
     UNICODE_SPACES_MAP = {key: ' ' for key in UNICODE_SPACES}
 
-# based on Django's but with limited schemes: https://github.com/django/django/blob/master/django/core/validators.py
-URL = re.compile(
-    r'^(?:http|https)://' # scheme
-    r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+(?:[A-Z]{2,6}\.?|[A-Z0-9-]{2,}(?<!-)\.?)|' # domain
-    r'localhost|' # localhost...
-    r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}|' # ...or ipv4
-    r'\[?[A-F0-9]*:[A-F0-9:]+\]?)' # ...or ipv6
-    r'(?::\d+)?' # optional port
-    r'(?:/?|[/?]\S+)$',
-    re.IGNORECASE
-)
+# everything except the normal ASCII space, which doesn't need converting
+NON_ASCII_SPACES = UNICODE_SPACES[1:]
+# for unicode.translate, which takes code points as keys on both Python 2 and 3
+NON_ASCII_SPACES_TABLE = dict((ord(space), u' ') for space in NON_ASCII_SPACES)
+
+# the forms that validateString's normalize can be
+NORMALIZATION_FORMS = frozenset(['NFC', 'NFKC', 'NFD', 'NFKD'])
+# translate tables for fold_confusables, with and without the unicode spaces, built the first time each is used
+_FOLD_TABLES = {}
+
+# the strptime directives that _dateParser can handle, with the datetime argument and pattern for each
+# these are the fixed width versions of what strptime accepts, so they only ever match a subset of it
+DATE_DIRECTIVES = {
+    'Y': ('year', '([0-9]{4})'),
+    'm': ('month', '([0-9]{2})'),
+    'd': ('day', '([0-9]{2})'),
+    'H': ('hour', '([0-9]{2})'),
+    'M': ('minute', '([0-9]{2})'),
+    'S': ('second', '([0-9]{2})'),
+    'f': ('microsecond', '([0-9]{1,6})')
+}
+_DATE_PARSERS = {}
+
+# set by gae_validators.instrument while instrumentation is enabled to record why values are rejected
+# it's only checked on the way to rejecting a value, so it costs next to nothing when disabled
+_sink = None
+
+# the normalized names of common encodings that encode each character on its own, so they can be checked in chunks
+CHUNKED_ENCODINGS = frozenset(['utf-8', 'utf-16', 'utf-16-le', 'utf-16-be', 'utf-32', 'utf-32-le', 'utf-32-be',
+    'iso8859-1', 'cp1252'])
+ENCODE_CHUNK_SIZE = 8192
+ASCII_CHARS = u''.join([u'%c' % i for i in range(128)])
+# functions that check whether text can be encoded to an encoding, filled in by _encodingCheck as they're used
+_ENCODING_CHECKS = {}
+
+try:
+    # this is constant time because python 3.7+ strings already know whether they're ASCII
+    _isAscii = str.isascii
+except AttributeError:
+    def _isAscii(source):
+        try:
+            source.encode('ascii')
+        except UnicodeError:
+            return False
+        return True
+
+# the range of national number lengths (i.e. excluding the country code) for each country calling code
+# generous where a country has several lengths, since the E.164 total of 15 digits is the only hard limit
+# formatted as "code:min-max" or "code:length" to keep it compact, and parsed by _countryCodes on first use
+COUNTRY_CODE_LENGTHS = """
+    1:10 7:10 20:8-10 27:9 30:10 31:9 32:8-9 33:9 34:9 36:8-9 39:6-11 40:9 41:9 43:4-13 44:7-10 45:8 46:6-10
+    47:5-8 48:9 49:5-13 51:8-9 52:10 53:6-8 54:10-11 55:10-11 56:9 57:8-10 58:10 60:8-10 61:6-9 62:7-12 63:8-10
+    64:8-10 65:8 66:8-9 81:9-10 82:7-10 84:9-10 86:9-11 90:10 91:10 92:9-10 93:9 94:9 95:7-10 98:10
+    211:9 212:9 213:8-9 216:8 218:8-9 220:7 221:9 222:8 223:8 224:8-9 225:8-10 226:8 227:8 228:8 229:8-10
+    230:7-8 231:7-9 232:8 233:9 234:7-10 235:8 236:8 237:8-9 238:7 239:7 240:9 241:7-8 242:9 243:7-9 244:9
+    245:7-9 246:7 247:4-5 248:7 249:9 250:9 251:9 252:7-9 253:8 254:9-10 255:9 256:9 257:8 258:8-9 260:9
+    261:9 262:9 263:5-10 264:8-10 265:7-9 266:8 267:7-8 268:8 269:7 290:4-5 291:7 297:7 298:6 299:6
+    350:8 351:9 352:4-11 353:7-9 354:7-9 355:8-9 356:8 357:8 358:5-12 359:7-9 370:8 371:8 372:7-8 373:8
+    374:8 375:9-10 376:6-9 377:8-9 378:6-10 380:9 381:8-10 382:8 383:8-9 385:8-9 386:8 387:8-9 389:8
+    420:9 421:9 423:7-9 500:5 501:7 502:8 503:8 504:8 505:8 506:8 507:7-8 508:6 509:8 590:9 591:8 592:7
+    593:8-9 594:9 595:6-9 596:9 597:6-7 598:8 599:7 670:7-8 672:5-6 673:7 674:7 675:7-8 676:5-7 677:5-7
+    678:5-7 679:7 680:7 681:6 682:5 683:4-7 685:5-7 686:5-8 687:6 688:5-7 689:6-8 690:4-7 691:7 692:7
+    800:8 808:8 850:8-10 852:8 853:8 855:8-9 856:8-10 870:9 878:10-12 880:8-10 881:8-9 882:8-12 883:9-12
+    886:8-9 888:11 960:7 961:7-8 962:8-9 963:8-9 964:8-10 965:8 966:9 967:7-9 968:8 970:8-9 971:8-9
+    972:8-9 973:8 974:8 975:7-8 976:8 977:8-10 979:9 992:9 993:8 994:9 995:9 996:9 998:9
+"""
+_country_codes = None
+
+# validateUrl follows the same rules as Django's URL regex but with limited schemes and without the backtracking
+# see https://github.com/django/django/blob/master/django/core/validators.py
+URL_SCHEMES = {'http': 80, 'https': 443}
+HEX_CHARS = '0123456789abcdefABCDEF'
+WHITESPACE = _LazyRegex(r'\s')
+
+
+class UrlParts(namedtuple('UrlParts', ['scheme', 'host', 'port', 'path', 'query', 'fragment'])):
+    # the result of validateUrlParts so that callers don't have to parse the URL again
+    # port is an int, and port, query, and fragment are None when not in the URL
+    __slots__ = ()
+
+    def geturl(self):
+        url = self.scheme + '://' + self.host
+        if self.port is not None:
+            url += ':' + str(self.port)
+        url += self.path
+        if self.query is not None:
+            url += '?' + self.query
+        if self.fragment is not None:
+            url += '#' + self.fragment
+        return url
+
+
+def _foldTable(convert_spaces):
+    # WARNING: this is a private method for internal use only - do not call directly
+    table = _FOLD_TABLES.get(convert_spaces)
+    if table is None:
+        from gae_validators.confusables import buildTable
+        table = buildTable()
+        if convert_spaces:
+            for space in NON_ASCII_SPACES:
+                table[ord(space)] = u' '
+        _FOLD_TABLES[convert_spaces] = table
+    return table
+
 
+def _fold(source, normalize, fold_confusables, convert_spaces):
+    # WARNING: this is a private method for internal use only - do not call directly
+    # applies the unicode normalization form and folds confusables for text that isn't ASCII
+    if normalize:
+        import unicodedata
+        source = unicodedata.normalize(normalize, source)
+
+    if fold_confusables:
+        # the unicode spaces are converted in the same pass as folding, if they're being converted at all
+        folded = source.translate(_foldTable(convert_spaces))
+        if normalize and folded != source and not _isAscii(folded):
+            # a combining mark that was after a folded letter might compose with it now
+            folded = unicodedata.normalize(normalize, folded)
+        source = folded
 
-def _condense(source, key='  ', value=' '):
-    # appears faster than regex for shorter strings
-    while key in source:
-        source = source.replace(key, value)
     return source
 
 
-def _translate(source, table):
-    if PY3:
-        source = source.translate(table)
+def _normalize(source, condense=True, convert_spaces=True):
+    # WARNING: this is a private method for internal use only - do not call directly
+    # converts unicode spaces, condenses runs of spaces, and strips, skipping any step that has nothing to do
+    # each check is a fast scan that doesn't allocate, so only the steps that change something make a copy
+
+    # convert_spaces is purposefully applied before condense
+    # a single kind of space is replaced, while more than one kind are translated all at once
+    # so that no input ever makes more than one extra copy
+    if convert_spaces and not _isAscii(source):
+        found = None
+        for space in NON_ASCII_SPACES:
+            if space in source:
+                if found is not None:
+                    source = source.translate(NON_ASCII_SPACES_TABLE)
+                    break
+                found = space
+        else:
+            if found is not None:
+                source = source.replace(found, ' ')
+
+    # replace appears faster than a regex here, since most inputs have no runs or only short ones
+    # and passes that find nothing don't copy, while each pass that does find something halves every run
+    if condense:
+        while '  ' in source:
+            source = source.replace('  ', ' ')
+
+    return source.strip()
+
+
+def _encodes(source, encoding, chunk_size=None):
+    # WARNING: this is a private method for internal use only - do not call directly
+    # encoding is the only general way to check, but the result is thrown away
+    # so with a chunk_size it's done a slice at a time to only ever hold a small part of the encoded copy
+    # which is only correct for encodings where each character is encoded independently
+    try:
+        if chunk_size and len(source) > chunk_size:
+            for start in range(0, len(source), chunk_size):
+                source[start:start + chunk_size].encode(encoding)
+        else:
+            source.encode(encoding)
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def _encodingCheck(encoding):
+    # WARNING: this is a private method for internal use only - do not call directly
+    # returns a function that checks whether text can be encoded to the encoding without encoding all of it at once
+    # this looks up the encoding once, so an unknown one raises a LookupError just like encoding would
+    import codecs
+    name = codecs.lookup(encoding).name
+
+    if name == 'ascii':
+        check = _isAscii
+    elif PY3 and name in CHUNKED_ENCODINGS:
+        # encoding in chunks is about as fast as a single encode (faster than a regex scan for surrogates)
+        def check(source):
+            return _isAscii(source) or _encodes(source, encoding, chunk_size=ENCODE_CHUNK_SIZE)
+    elif _encodes(ASCII_CHARS, encoding):
+        # any ASCII text can be encoded, so only other text needs a full encode
+        def check(source):
+            return _isAscii(source) or _encodes(source, encoding)
     else:
-        for key, value in table.iteritems():
-            source = source.replace(key, value)
+        def check(source):
+            return _encodes(source, encoding)
 
-    return source
+    _ENCODING_CHECKS[encoding] = check
+    return check
+
+
+# text is handled the same way on both versions in validateString
+# so only the version specific handling of everything else is picked once here rather than checked on every call
+if PY3:
+    def _decode(source, encoding):
+        # WARNING: this is a private method for internal use only - do not call directly
+        # returns the source as text, or None if it can't be decoded from or encoded to the encoding
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            # str decodes straight from the buffer, without copying a bytearray or memoryview to bytes first
+            try:
+                return str(source, encoding)
+            except UnicodeDecodeError:
+                return None
+
+        value = str(source)
+        check = _ENCODING_CHECKS.get(encoding) or _encodingCheck(encoding)
+        if not check(value):
+            return None
+        return value
+else:
+    def _decode(source, encoding):
+        # WARNING: this is a private method for internal use only - do not call directly
+        # returns the source as text, or None if it can't be decoded from or encoded to the encoding
+        if isinstance(source, unicode):
+            check = _ENCODING_CHECKS.get(encoding) or _encodingCheck(encoding)
+            if not check(source):
+                return None
+            return source
 
+        if isinstance(source, memoryview):
+            source = source.tobytes()
 
-def validateString(source, max_length=500, newlines=False, encoding='utf-8', condense=True, convert_spaces=True):
+        try:
+            if isinstance(source, bytearray):
+                return source.decode(encoding)
+            return unicode(source, encoding)
+        except UnicodeDecodeError:
+            return None
+
+
+def validateString(source, max_length=500, newlines=False, encoding='utf-8', condense=True, convert_spaces=True,
+        normalize=None, fold_confusables=False):
+    # normalize is an optional unicode normalization form (NFC, NFKC, NFD, or NFKD) to apply
+    # fold_confusables replaces letters and punctuation that look just like ASCII ones, like a Cyrillic "a",
+    # with the ASCII ones, and removes invisible characters, so that e.g. usernames can't impersonate each other
+    if normalize and normalize not in NORMALIZATION_FORMS:
+        raise ValueError('Unknown normalization form: %s' % normalize)
 
     valid = True
     if source is None:
         value = ''
-    elif PY3:
-        if isinstance(source, bytes):
-            try:
-                value = source.decode(encoding)
-            except UnicodeDecodeError:
-                value = ''
-                valid = False
-        else:
-            value = str(source)
-            try:
-                value.encode(encoding)
-            except UnicodeEncodeError:
-                value = ''
-                valid = False
+    elif type(source) is unicode:
+        value = source
+        check = _ENCODING_CHECKS.get(encoding) or _encodingCheck(encoding)
+        if not check(source):
+            value = ''
+            valid = False
     else:
-        if isinstance(source, unicode):
-            value = source
-            try:
-                source.encode(encoding)
-            except UnicodeEncodeError:
-                value = ''
-                valid = False
-        else:
-            try:
-                value = unicode(source, encoding)
-            except UnicodeDecodeError:
-                value = ''
-                valid = False
+        value = _decode(source, encoding)
+        if value is None:
+            value = ''
+            valid = False
 
-    if valid:
-        # convert_spaces is purposefully applied before condense
-        if convert_spaces:
-            value = _translate(value, UNICODE_SPACES_MAP)
+    # ASCII text is the same in every normalization form and has nothing to fold, so it skips both
+    if valid and (normalize or fold_confusables) and not _isAscii(value):
+        value = _fold(value, normalize, fold_confusables, convert_spaces)
+        if fold_confusables:
+            convert_spaces = False
 
-        if condense:
-            value = _condense(value)
+        # normalizing can compose or decompose characters into ones that the encoding doesn't have
+        if normalize and not (_ENCODING_CHECKS.get(encoding) or _encodingCheck(encoding))(value):
+            value = ''
+            valid = False
+
+    if not valid and _sink is not None:
+        _sink.reject('validateString', 'bad encoding')
 
-        value = value.strip()
+    if valid:
+        value = _normalize(value, condense=condense, convert_spaces=convert_spaces)
 
         if len(value) > max_length:
             valid = False
+            if _sink is not None:
+                _sink.reject('validateString', 'too long')
         elif not newlines and ('\n' in value or '\r' in value):
             valid = False
+            if _sink is not None:
+                _sink.reject('validateString', 'newline')
 
     return valid, value
 
 
 def validateRequiredString(source, min_length=1, max_length=500, newlines=False, encoding='utf-8',
-        condense=True, convert_spaces=True):
+        condense=True, convert_spaces=True, normalize=None, fold_confusables=False):
 
     valid, value = validateString(source, max_length=max_length, newlines=newlines, encoding=encoding,
-        condense=condense, convert_spaces=convert_spaces)
+        condense=condense, convert_spaces=convert_spaces, normalize=normalize, fold_confusables=fold_confusables)
 
     if valid and len(value) < min_length:
         valid = False
+        if _sink is not None:
+            _sink.reject('validateRequiredString', 'too short')
 
     return valid, value
 
 
-def validateText(source, max_length=ONE_MB, newlines=True, encoding='utf-8', condense=True, convert_spaces=True):
+def validateText(source, max_length=ONE_MB, newlines=True, encoding='utf-8', condense=True, convert_spaces=True,
+        normalize=None, fold_confusables=False):
 
     return validateString(source, max_length=max_length, newlines=newlines, encoding=encoding,
-        condense=condense, convert_spaces=convert_spaces)
+        condense=condense, convert_spaces=convert_spaces, normalize=normalize, fold_confusables=fold_confusables)
 
 
 def validateRequiredText(source, min_length=1, max_length=ONE_MB, newlines=True, encoding='utf-8',
-        condense=True, convert_spaces=True):
+        condense=True, convert_spaces=True, normalize=None, fold_confusables=False):
 
     return validateRequiredString(source, min_length=min_length, max_length=max_length,
-        newlines=newlines, encoding=encoding, condense=condense, convert_spaces=convert_spaces)
+        newlines=newlines, encoding=encoding, condense=condense, convert_spaces=convert_spaces,
+        normalize=normalize, fold_confusables=fold_confusables)
+
+
+def _decodePunycode(label):
+    # WARNING: this is a private method for internal use only - do not call directly
+    # returns the unicode form of an xn-- label, or None if it isn't valid punycode
+    try:
+        return label.encode('ascii').decode('idna')
+    except UnicodeError:
+        return None
+
 
+def _validPunycodeTld(tld):
+    # WARNING: this is a private method for internal use only - do not call directly
+    # the decoded TLD has to follow the same rules as an ASCII one, so e.g. a single letter or digits aren't allowed
+    if tld[:4].lower() != 'xn--' or not 4 < len(tld) < 64 or tld[-1] == '-' or tld.strip(DOMAIN_LABEL_CHARS):
+        return False
 
-def validateEmail(source):
+    decoded = _decodePunycode(tld)
+    return decoded is not None and len(decoded) >= 2 and decoded.isalpha()
+
+
+def _validateDomain(domain):
+    # WARNING: this is a private method for internal use only - do not call directly
+    # checks one or more labels of up to 63 letters, numbers, or hyphens, followed by a TLD of at least two letters
+    # this is done in a single pass over the labels rather than with a regex, which can backtrack a lot
+    # on long domains that fail near the end
+    if not _isAscii(domain):
+        # internationalized domains are checked in their ASCII form, which also normalizes them
+        try:
+            domain = domain.encode('idna').decode('ascii')
+        except UnicodeError:
+            if _sink is not None:
+                _sink.reject('validateEmail', 'bad IDN')
+            return False
+
+    labels = domain.split('.')
+    tld = labels.pop()
+    if not labels or len(tld) < 2:
+        if _sink is not None:
+            _sink.reject('validateEmail', 'bad TLD')
+        return False
+
+    if not tld.isalpha():
+        # punycode TLDs (e.g. xn--p1ai) are also allowed, as long as they're a valid label that decodes
+        if not _validPunycodeTld(tld):
+            if _sink is not None:
+                _sink.reject('validateEmail', 'bad TLD')
+            return False
+
+    for label in labels:
+        # stripping the allowed characters only leaves something behind if there's a character that isn't allowed
+        if not 0 < len(label) < 64 or label[0] == '-' or label.strip(DOMAIN_LABEL_CHARS):
+            if _sink is not None:
+                _sink.reject('validateEmail', 'bad domain label')
+            return False
+
+        # an internationalized label can't start with a hyphen either, which only shows once it's decoded
+        if label[:4].lower() == 'xn--':
+            decoded = _decodePunycode(label)
+            if not decoded or decoded[0] == '-':
+                if _sink is not None:
+                    _sink.reject('validateEmail', 'bad domain label')
+                return False
+
+    return True
+
+
+def _blockedDomain(domain, blocked_domains):
+    # WARNING: this is a private method for internal use only - do not call directly
+    # checks the domain and each of its parents, so blocking a domain also blocks all of its subdomains
+    domain = domain.lower()
+    if not _isAscii(domain):
+        domain = domain.encode('idna').decode('ascii')
+
+    labels = domain.split('.')
+    for i in range(len(labels)):
+        if '.'.join(labels[i:]) in blocked_domains:
+            return True
+
+    return False
+
+
+def validateEmail(source, blocked_domains=None):
+    # blocked_domains is an optional container of lowercase ASCII domains to reject
+    # like a set or a gae_validators.domains.DomainIndex for large lists
 
     valid, value = validateString(source)
 
@@ -159,38 +468,110 @@ def validateEmail(source):
         parts = value.split('@')
         if len(parts) != 2:
             valid = False
+            if _sink is not None:
+                _sink.reject('validateEmail', 'not one @')
         else:
             username, domain = parts
 
-            if not EMAIL_USER.search(username) or not EMAIL_DOMAIN.search(domain):
+            if not EMAIL_USER.search(username):
+                valid = False
+                if _sink is not None:
+                    _sink.reject('validateEmail', 'bad username')
+            elif not _validateDomain(domain):
+                valid = False
+            elif blocked_domains is not None and _blockedDomain(domain, blocked_domains):
                 valid = False
+                if _sink is not None:
+                    _sink.reject('validateEmail', 'blocked domain')
 
     return valid, value
 
 
-def validateRequiredEmail(source):
+def validateRequiredEmail(source, blocked_domains=None):
 
-    valid, value = validateEmail(source)
+    valid, value = validateEmail(source, blocked_domains=blocked_domains)
 
     if valid and not value:
         valid = False
+        if _sink is not None:
+            _sink.reject('validateRequiredEmail', 'required')
 
     return valid, value
 
 
-def _validateDigitString(source, min_length=10, max_length=15):
+def _digits(source):
     # WARNING: this is a private method for internal use only - do not call directly
-    valid = True
-    value = ''
+    # a list comprehension appears faster than a regex or a character by character state machine for phone numbers
+    digits = ''.join([char for char in source if char.isdigit()])
+    if not _isAscii(digits):
+        # normalize other unicode digits (e.g. fullwidth ones) to ASCII
+        import unicodedata
+        digits = ''.join([str(unicodedata.digit(char)) for char in digits])
+    return digits
 
-    digits = [char for char in source if char.isdigit()]
-    length = len(digits)
-    if length < min_length or length > max_length:
-        valid = False
-    else:
-        value = ''.join(digits)
 
-    return valid, value
+def _parsePhone(source, separators, extension_max_length):
+    # WARNING: this is a private method for internal use only - do not call directly
+    # returns the full number in E.164 format and the extension, either of which can be None if invalid
+    ext = None
+    if separators:
+        # split at the last separator in the source, so the number is on the left and the extension on the right
+        # each search is a fast scan rather than a loop in python
+        split = end = -1
+        for sep in separators:
+            if sep:
+                index = source.rfind(sep)
+                if index > split:
+                    split = index
+                    end = index + len(sep)
+
+        if split >= 0:
+            ext = _digits(source[end:])
+            if not 0 < len(ext) <= extension_max_length:
+                ext = None
+            source = source[:split]
+
+    return _toE164(_digits(source), source.lstrip('( ').startswith('+')), ext
+
+
+def _countryCodes():
+    # WARNING: this is a private method for internal use only - do not call directly
+    # parses COUNTRY_CODE_LENGTHS into a dict of code to (min, max) the first time a phone number is validated
+    # the whole dict is built before it's assigned, so other threads never see it half done
+    global _country_codes
+    _country_codes = dict((code, (int(lengths.split('-')[0]), int(lengths.split('-')[-1])))
+        for code, lengths in (entry.split(':') for entry in COUNTRY_CODE_LENGTHS.split()))
+    return _country_codes
+
+
+def _toE164(digits, plus):
+    # WARNING: this is a private method for internal use only - do not call directly
+    if not plus:
+        if digits.startswith('00'):
+            # the international call prefix used in most of the world
+            digits = digits[2:]
+        elif digits.startswith('011'):
+            # the international call prefix used in the US and Canada
+            digits = digits[3:]
+        elif len(digits) == 10:
+            # assume US/Canada with the country code missing
+            digits = '1' + digits
+
+    country_codes = _country_codes or _countryCodes()
+
+    # country codes are prefix free, so the first one that matches is the only one that can
+    for length in (1, 2, 3):
+        lengths = country_codes.get(digits[:length])
+        if lengths:
+            if lengths[0] <= len(digits) - length <= lengths[1]:
+                return '+' + digits
+            if _sink is not None:
+                _sink.reject('validatePhone', 'bad length for country')
+            return None
+
+    if _sink is not None:
+        _sink.reject('validatePhone', 'unknown country code')
+    return None
 
 
 def validatePhone(source, extension_separators=None, extension_max_length=5):
@@ -198,28 +579,14 @@ def validatePhone(source, extension_separators=None, extension_max_length=5):
     valid, value = validateString(source)
 
     if valid and value:
-        ext = None
-        if extension_separators:
-            for sep in extension_separators:
-                if sep in value:
-                    value, ext_source = value.rsplit(sep, 1)
-                    if ext_source:
-                        ext_valid, ext_value = _validateDigitString(ext_source,
-                            min_length=1, max_length=extension_max_length)
-                        if ext_valid:
-                            ext = ext_value
-                    break
-
-        valid, digits = _validateDigitString(value)
-        if valid:
-            if len(digits) == 10:
-                # assume US/Canada with the country code missing
-                digits = '1' + digits
-            value = '+' + digits
-
+        number, ext = _parsePhone(value, extension_separators, extension_max_length)
+        if number:
+            value = number
             if ext:
                 # this is the E.164 way of specifying extensions
                 value += ';ext=' + ext
+        else:
+            valid = False
 
     return valid, value
 
@@ -230,11 +597,156 @@ def validateRequiredPhone(source):
 
     if valid and not value:
         valid = False
+        if _sink is not None:
+            _sink.reject('validateRequiredPhone', 'required')
+
+    return valid, value
+
+
+def _validateHost(host):
+    # WARNING: this is a private method for internal use only - do not call directly
+    # a domain name, localhost, an IPv4 address, or (loosely) an IPv6 address
+    labels = host.split('.')
+    fully_qualified = len(labels) > 1 and not labels[-1] and host[-2:] != '..'
+    if fully_qualified:
+        # a single trailing dot is allowed for domains but not IP addresses
+        labels.pop()
+
+    if len(labels) > 1:
+        tld = labels.pop()
+        if len(tld) > 1 and tld[-1] != '-' and not tld.strip(DOMAIN_LABEL_CHARS):
+            for label in labels:
+                if not 0 < len(label) < 64 or label[0] == '-' or label[-1] == '-' or label.strip(DOMAIN_LABEL_CHARS):
+                    break
+            else:
+                return True
+
+        labels.append(tld)
+        if len(labels) == 4 and not fully_qualified:
+            for label in labels:
+                if not 0 < len(label) < 4 or label.strip('0123456789'):
+                    break
+            else:
+                return True
+
+    if host.lower() == 'localhost':
+        return True
+
+    if ':' in host:
+        if host[0] == '[':
+            host = host[1:]
+        if host[-1:] == ']':
+            host = host[:-1]
+        # there has to be something after the first colon
+        return not host.strip(HEX_CHARS + ':') and host.find(':') < len(host) - 1
+
+    return False
+
+
+def _parseUrl(source, normalize=False):
+    # WARNING: this is a private method for internal use only - do not call directly
+    # splits a URL into its parts in one pass, returning None if it isn't valid
+    scheme, sep, rest = source.partition('://')
+    if not sep or scheme.lower() not in URL_SCHEMES:
+        if _sink is not None:
+            _sink.reject('validateUrl', 'bad scheme')
+        return None
+
+    # the host and port end at the start of the path or query
+    end = len(rest)
+    for char in '/?':
+        index = rest.find(char, 0, end)
+        if index >= 0:
+            end = index
+
+    host = rest[:end]
+    tail = rest[end:]
+
+    if len(tail) > 1 and WHITESPACE.search(tail):
+        if _sink is not None:
+            _sink.reject('validateUrl', 'whitespace')
+        return None
+    elif tail == '?':
+        if _sink is not None:
+            _sink.reject('validateUrl', 'empty query')
+        return None
+
+    # internationalized hosts are checked in their ASCII form, but only returned that way when normalizing
+    checked = host
+    if not _isAscii(host):
+        try:
+            checked = host.encode('idna').decode('ascii')
+            # a label can't start or end with a hyphen, which only shows before it's encoded
+            for label in host.split('.'):
+                if label[:1] == '-' or label[-1:] == '-':
+                    raise UnicodeError()
+        except UnicodeError:
+            if _sink is not None:
+                _sink.reject('validateUrl', 'bad IDN')
+            return None
+        if normalize:
+            host = checked
+
+    port = None
+    if not _validateHost(checked):
+        # IPv6 addresses have colons too, so the port can only be split off once the whole thing has been tried
+        checked, sep, port = checked.rpartition(':')
+        if not sep or not port or port.strip('0123456789') or not checked or not _validateHost(checked):
+            if _sink is not None:
+                _sink.reject('validateUrl', 'bad host or port')
+            return None
+        host = host.rpartition(':')[0]
+        port = int(port)
+
+    tail, sep, fragment = tail.partition('#')
+    if not sep:
+        fragment = None
+
+    path, sep, query = tail.partition('?')
+    if not sep:
+        query = None
+
+    if normalize:
+        scheme = scheme.lower()
+        host = host.lower()
+        if port == URL_SCHEMES[scheme]:
+            port = None
+
+    return UrlParts(scheme, host, port, path, query, fragment)
+
+
+def validateUrlParts(source, normalize=False):
+    # the same as validateUrl except that the value is a UrlParts tuple, or None if invalid or empty
+    # normalize lowercases the scheme and host, removes the default port, and IDNA encodes internationalized hosts
+
+    valid, value = validateString(source)
+
+    if valid and value:
+        if '//' not in value:
+            value = 'http://' + value
+
+        value = _parseUrl(value, normalize=normalize)
+        if not value:
+            valid = False
+    else:
+        value = None
+
+    return valid, value
+
+
+def validateRequiredUrlParts(source, normalize=False):
+
+    valid, value = validateUrlParts(source, normalize=normalize)
+
+    if valid and not value:
+        valid = False
+        if _sink is not None:
+            _sink.reject('validateRequiredUrlParts', 'required')
 
     return valid, value
 
 
-def validateUrl(source):
+def validateUrl(source, normalize=False):
 
     valid, value = validateString(source)
 
@@ -242,28 +754,89 @@ def validateUrl(source):
         if '//' not in value:
             value = 'http://' + value
 
-        if not URL.search(value):
+        parts = _parseUrl(value, normalize=normalize)
+        if not parts:
             valid = False
+        elif normalize:
+            value = parts.geturl()
 
     return valid, value
 
 
-def validateRequiredUrl(source):
+def validateRequiredUrl(source, normalize=False):
 
-    valid, value = validateUrl(source)
+    valid, value = validateUrl(source, normalize=normalize)
 
     if valid and not value:
         valid = False
+        if _sink is not None:
+            _sink.reject('validateRequiredUrl', 'required')
 
     return valid, value
 
 
+class ChoiceSet(object):
+    # a set of options built once for constant time lookups in validateChoices, instead of searching a list
+    # ignore_case and normalize (condensing and converting spaces like validateString) make matching looser
+    # in which case validateChoices returns the original option that matched rather than the input
+
+    def __init__(self, options=(), ignore_case=False, normalize=False):
+        self.ignore_case = ignore_case
+        self.normalize = normalize
+        self._options = {}
+        for option in options:
+            self.add(option)
+
+    @classmethod
+    def fromFile(cls, source, encoding='utf-8', **kwargs):
+        # source is a path or a file object with one option per line, which is read lazily
+        if hasattr(source, 'read'):
+            return cls((line.rstrip('\r\n') for line in source if line.strip()), **kwargs)
+
+        with io.open(source, encoding=encoding) as f:
+            return cls.fromFile(f, **kwargs)
+
+    def _key(self, value):
+        if isinstance(value, (str, unicode)):
+            if self.normalize:
+                value = _normalize(value)
+            if self.ignore_case:
+                value = value.lower()
+        return value
+
+    def add(self, option):
+        # if several options match each other the first one added wins
+        self._options.setdefault(self._key(option), option)
+
+    def get(self, value, default=None):
+        # returns the original option that matches the value
+        return self._options.get(self._key(value), default)
+
+    def __contains__(self, value):
+        return self._key(value) in self._options
+
+    def __iter__(self):
+        return iter(self._options.values())
+
+    def __len__(self):
+        return len(self._options)
+
+
 def validateChoices(source, choices):
 
     valid, value = validateString(source)
 
     if valid and value:
-        valid = value in choices
+        if isinstance(choices, ChoiceSet):
+            match = choices.get(value)
+            valid = match is not None
+            if valid:
+                value = match
+        else:
+            valid = value in choices
+
+        if not valid and _sink is not None:
+            _sink.reject('validateChoices', 'not a choice')
 
     return valid, value
 
@@ -274,6 +847,8 @@ def validateRequiredChoices(source, choices):
 
     if valid and not value:
         valid = False
+        if _sink is not None:
+            _sink.reject('validateRequiredChoices', 'required')
 
     return valid, value
 
@@ -297,9 +872,13 @@ def validateInt(source, min_amount=-INT_SIZE, max_amount=INT_SIZE - 1):
         except ValueError:
             value = None
             valid = False
+            if _sink is not None:
+                _sink.reject('validateInt', 'not a number')
 
         if valid and (min_amount > value or max_amount < value):
             valid = False
+            if _sink is not None:
+                _sink.reject('validateInt', 'out of range')
     else:
         value = None
 
@@ -312,6 +891,8 @@ def validateRequiredInt(source, min_amount=-INT_SIZE, max_amount=INT_SIZE - 1):
 
     if valid and not value:
         valid = False
+        if _sink is not None:
+            _sink.reject('validateRequiredInt', 'required')
 
     return valid, value
 
@@ -325,9 +906,13 @@ def validateFloat(source, min_amount=-INT_SIZE, max_amount=INT_SIZE - 1):
         except ValueError:
             value = None
             valid = False
+            if _sink is not None:
+                _sink.reject('validateFloat', 'not a number')
 
         if valid and (min_amount > value or max_amount < value):
             valid = False
+            if _sink is not None:
+                _sink.reject('validateFloat', 'out of range')
     else:
         value = None
 
@@ -340,47 +925,126 @@ def validateRequiredFloat(source, min_amount=-INT_SIZE, max_amount=INT_SIZE - 1)
 
     if valid and not value:
         valid = False
+        if _sink is not None:
+            _sink.reject('validateRequiredFloat', 'required')
 
     return valid, value
 
 
-def validateDateTime(source, date_format="%Y-%m-%dT%H:%M", future_only=False, past_only=False):
+def _compileDateParser(date_format):
+    # WARNING: this is a private method for internal use only - do not call directly
+    import re
+
+    parts = []
+    names = []
+    directive = False
+    for char in date_format:
+        if directive:
+            directive = False
+            if char not in DATE_DIRECTIVES or DATE_DIRECTIVES[char][0] in names:
+                return None
+            name, pattern = DATE_DIRECTIVES[char]
+            names.append(name)
+            parts.append(pattern)
+        elif char == '%':
+            directive = True
+        else:
+            parts.append(re.escape(char))
+
+    if not names or directive:
+        return None
+
+    match = re.compile(''.join(parts) + r'\Z').match
+
+    def parser(source):
+        result = match(source)
+        if result:
+            # these are the same defaults that strptime uses for anything missing from the format
+            fields = {'year': 1900, 'month': 1, 'day': 1}
+            for name, value in zip(names, result.groups()):
+                if name == 'microsecond':
+                    # like strptime this is a fraction of a second, so "5" means 500000
+                    value = value.ljust(6, '0')
+                fields[name] = int(value)
+            try:
+                return datetime(**fields)
+            except ValueError:
+                # leave it to strptime to decide, e.g. a month of 13 can't be valid
+                # but "2020131" can still be valid for "%Y%m%d" if it's parsed as a one digit month
+                pass
+        return None
+
+    return parser
+
+
+def _dateParser(date_format):
+    # WARNING: this is a private method for internal use only - do not call directly
+    # returns a function that parses fixed width formats like the ISO defaults much faster than strptime
+    # or None if the format uses anything else, which means strptime has to be used
+    # the function returns None if it can't parse a source, which could still be valid for strptime
+    # (e.g. a single digit month), so it's only ever a fast path for strptime rather than a replacement
+    try:
+        return _DATE_PARSERS[date_format]
+    except KeyError:
+        parser = _DATE_PARSERS[date_format] = _compileDateParser(date_format)
+        return parser
+
+
+def validateDateTime(source, date_format="%Y-%m-%dT%H:%M", future_only=False, past_only=False, now=None):
     # note that this is not aware of timezones
     # recommend ISO format for sending from JS or other non-user sources: "%Y-%m-%dT%H:%M:%S.%fZ"
+    # now is the UTC time to compare against for future_only and past_only, which defaults to the current time
+    # but can be passed in to share one snapshot of the clock across many calls
     assert not future_only or not past_only, "There are no dates in both the future and the past."
 
     valid = True
     if source:
-        try:
-            value = datetime.strptime(source, date_format)
-        except ValueError:
-            value = None
-            valid = False
+        parser = _dateParser(date_format)
+        value = parser(source) if parser else None
 
-        if valid:
-            if future_only and value < datetime.utcnow():
+        if value is None:
+            try:
+                value = datetime.strptime(source, date_format)
+            except ValueError:
                 valid = False
-            elif past_only and value > datetime.utcnow():
+                if _sink is not None:
+                    _sink.reject('validateDateTime', 'bad format')
+
+        if valid and (future_only or past_only):
+            if now is None:
+                now = datetime.utcnow()
+
+            if future_only and value < now:
                 valid = False
+                if _sink is not None:
+                    _sink.reject('validateDateTime', 'not in the future')
+            elif past_only and value > now:
+                valid = False
+                if _sink is not None:
+                    _sink.reject('validateDateTime', 'not in the past')
     else:
         value = None
 
     return valid, value
 
 
-def validateRequiredDateTime(source, date_format="%Y-%m-%dT%H:%M", future_only=False, past_only=False):
+def validateRequiredDateTime(source, date_format="%Y-%m-%dT%H:%M", future_only=False, past_only=False, now=None):
 
-    valid, value = validateDateTime(source, date_format=date_format, future_only=future_only, past_only=past_only)
+    valid, value = validateDateTime(source, date_format=date_format, future_only=future_only, past_only=past_only,
+        now=now)
 
     if valid and not value:
         valid = False
+        if _sink is not None:
+            _sink.reject('validateRequiredDateTime', 'required')
 
     return valid, value
 
 
-def validateDate(source, date_format="%Y-%m-%d", future_only=False, past_only=False):
+def validateDate(source, date_format="%Y-%m-%d", future_only=False, past_only=False, now=None):
 
-    valid, value = validateDateTime(source, date_format=date_format, future_only=future_only, past_only=past_only)
+    valid, value = validateDateTime(source, date_format=date_format, future_only=future_only, past_only=past_only,
+        now=now)
 
     if value:
         value = value.date()
@@ -388,12 +1052,15 @@ def validateDate(source, date_format="%Y-%m-%d", future_only=False, past_only=Fa
     return valid, value
 
 
-def validateRequiredDate(source, date_format="%Y-%m-%d", future_only=False, past_only=False):
+def validateRequiredDate(source, date_format="%Y-%m-%d", future_only=False, past_only=False, now=None):
 
-    valid, value = validateDate(source, date_format=date_format, future_only=future_only, past_only=past_only)
+    valid, value = validateDate(source, date_format=date_format, future_only=future_only, past_only=past_only,
+        now=now)
 
     if valid and not value:
         valid = False
+        if _sink is not None:
+            _sink.reject('validateRequiredDate', 'required')
 
     return valid, value
 
@@ -414,5 +1081,102 @@ def validateRequiredTime(source, time_format="%H:%M"):
 
     if valid and not value:
         valid = False
+        if _sink is not None:
+            _sink.reject('validateRequiredTime', 'required')
 
     return valid, value
+
+
+class Schema(object):
+    # compiles a mapping of field names to validators once so that a whole form can be validated in one call
+    # each field is either a validator or a tuple of (validator, kwargs) to bind non-default parameters
+    # e.g. Schema({'email': validateRequiredEmail, 'age': (validateInt, {'min_amount': 13})})
+
+    def __init__(self, fields):
+        if hasattr(fields, 'items'):
+            fields = fields.items()
+
+        self.fields = []
+        for name, spec in fields:
+            if isinstance(spec, tuple):
+                validator, kwargs = spec
+                if kwargs:
+                    from functools import partial
+                    validator = partial(validator, **kwargs)
+            else:
+                validator = spec
+            self.fields.append((name, validator))
+
+        self.names = tuple(name for name, validator in self.fields)
+        self.validators = dict(self.fields)
+        self.validate = self._compile()
+
+    def __call__(self, source):
+        return self.validate(source)
+
+    def lazy(self, source):
+        # returns a LazyRecord that only validates each field the first time it's used
+        return LazyRecord(self, source)
+
+    def _compile(self):
+        # bind everything the loop needs to locals so each call only pays for the validators themselves
+        fields = tuple(self.fields)
+
+        def validate(source):
+            # source can be a dict or anything else with a `get` method, like a MultiDict
+            get = source.get if source is not None else {}.get
+            values = {}
+            errors = []
+            for name, validator in fields:
+                valid, value = validator(get(name))
+                values[name] = value
+                if not valid:
+                    errors.append(name)
+
+            return not errors, values, errors
+
+        return validate
+
+
+class LazyRecord(object):
+    # the result of Schema.lazy, for handlers that only use some of the fields depending on what they do
+    # each field is validated the first time it's read, e.g. `record['email']`, and the result is kept
+    # so fields that are never read are never validated
+    # reading a field that isn't in the schema raises a KeyError
+    __slots__ = ('_schema', '_get', '_results')
+
+    def __init__(self, schema, source):
+        self._schema = schema
+        # source can be a dict or anything else with a `get` method, like a MultiDict
+        self._get = source.get if source is not None else {}.get
+        self._results = {}
+
+    def result(self, name):
+        # the `(valid, value)` tuple for a field
+        try:
+            return self._results[name]
+        except KeyError:
+            result = self._results[name] = self._schema.validators[name](self._get(name))
+            return result
+
+    def __getitem__(self, name):
+        return self.result(name)[1]
+
+    def __contains__(self, name):
+        return name in self._schema.validators
+
+    def isValid(self, name=None):
+        # checks a single field, or every field if no name is given
+        if name is not None:
+            return self.result(name)[0]
+        return not self.errors
+
+    @property
+    def errors(self):
+        # the names of every field that fails, in schema order, like Schema.validate returns
+        return [name for name in self._schema.names if not self.result(name)[0]]
+
+    @property
+    def values(self):
+        # a dict of every field name to its validated value, like Schema.validate returns
+        return dict((name, self.result(name)[1]) for name in self._schema.names)
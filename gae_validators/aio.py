@@ -0,0 +1,27 @@
+# asyncio support so that validating large inputs doesn't block the event loop
+# small inputs are validated inline, since handing them off would cost more than the validation itself
+# while anything larger than `max_inline` is sent to an executor (the loop's default thread pool unless one is given)
+# requires Python 3.7 or later
+
+import asyncio
+from functools import partial
+
+# validateText accepts up to a megabyte, which can take milliseconds to process
+INLINE_SIZE = 2 ** 16
+
+
+async def validateAsync(validator, source, max_inline=INLINE_SIZE, executor=None, **kwargs):
+    # a coroutine of the usual `(valid, value)` tuple, e.g.:
+    # valid, value = await validateAsync(validateText, body, max_length=ONE_MB)
+    # for CPU bound work a ProcessPoolExecutor can be passed in as the executor
+    # in which case the validator must be importable by the worker processes
+    try:
+        size = len(source)
+    except TypeError:
+        size = 0
+
+    if size <= max_inline:
+        return validator(source, **kwargs)
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(validator, source, **kwargs))
@@ -0,0 +1,383 @@
+# batch versions of every validator for validating many values at once
+# each takes an iterable of sources plus the same parameters as its scalar counterpart
+# and returns a tuple of `(flags, values)` where `flags` is a bytearray with a 1 for each valid source
+# and `values` is a list of the validated values in the same order
+# parameters are resolved once per batch instead of once per value, and the results are identical to
+# calling the scalar validator on each source
+
+from datetime import datetime
+from functools import partial
+
+import gae_validators as scalar
+from gae_validators import ONE_MB, INT_SIZE, PY3
+
+if PY3:
+    unicode = str
+
+
+def _batch(validator, sources, **kwargs):
+    # WARNING: this is a private method for internal use only - do not call directly
+    if kwargs:
+        validator = partial(validator, **kwargs)
+
+    flags = bytearray()
+    values = []
+    append_flag = flags.append
+    append_value = values.append
+
+    for source in sources:
+        valid, value = validator(source)
+        append_flag(valid)
+        append_value(value)
+
+    return flags, values
+
+
+def _now(future_only, past_only, now):
+    # WARNING: this is a private method for internal use only - do not call directly
+    # one snapshot of the clock is shared by the whole batch rather than checking it for every value
+    assert not future_only or not past_only, "There are no dates in both the future and the past."
+
+    if now is None and (future_only or past_only):
+        now = datetime.utcnow()
+
+    return now
+
+
+def _hashableChoices(choices):
+    # WARNING: this is a private method for internal use only - do not call directly
+    # membership in a set gives the same answer as in a list or tuple of strings, but in constant time
+    # anything else (like a string, where `in` matches substrings) is left as it is
+    if not isinstance(choices, (list, tuple)):
+        return choices
+
+    try:
+        return frozenset(choices)
+    except TypeError:
+        return choices
+
+
+def _strings(sources, max_length, newlines, encoding, condense, convert_spaces, normalize, fold_confusables,
+        min_length=0):
+    # WARNING: this is a private method for internal use only - do not call directly
+    # this is the same logic as validateString (and validateRequiredString with a min_length) inlined into a single
+    # loop, with the encoding check and normalization form looked up once for the whole batch
+    if scalar._sink is not None:
+        # go through the scalar validators so that instrumentation can see each call
+        kwargs = dict(max_length=max_length, newlines=newlines, encoding=encoding, condense=condense,
+            convert_spaces=convert_spaces, normalize=normalize, fold_confusables=fold_confusables)
+        if min_length:
+            return _batch(scalar.validateRequiredString, sources, min_length=min_length, **kwargs)
+        return _batch(scalar.validateString, sources, **kwargs)
+
+    if normalize and normalize not in scalar.NORMALIZATION_FORMS:
+        raise ValueError('Unknown normalization form: %s' % normalize)
+
+    check = scalar._ENCODING_CHECKS.get(encoding) or scalar._encodingCheck(encoding)
+    decode = scalar._decode
+    isAscii = scalar._isAscii
+    fold = scalar._fold
+    normalizeSpaces = scalar._normalize
+    folding = normalize or fold_confusables
+    # folding confusables converts the spaces in the same pass
+    fold_spaces = convert_spaces and not fold_confusables
+
+    flags = bytearray()
+    values = []
+    append_flag = flags.append
+    append_value = values.append
+
+    for source in sources:
+        if source is None:
+            valid = True
+            value = ''
+        elif type(source) is unicode:
+            valid = check(source)
+            value = source if valid else ''
+        else:
+            value = decode(source, encoding)
+            valid = value is not None
+            if not valid:
+                value = ''
+
+        if valid:
+            spaces = convert_spaces
+            if folding and not isAscii(value):
+                value = fold(value, normalize, fold_confusables, convert_spaces)
+                spaces = fold_spaces
+                if normalize and not check(value):
+                    valid = False
+                    value = ''
+
+            if valid:
+                value = normalizeSpaces(value, condense, spaces)
+                if not min_length <= len(value) <= max_length:
+                    valid = False
+                elif not newlines and ('\n' in value or '\r' in value):
+                    valid = False
+
+        append_flag(valid)
+        append_value(value)
+
+    return flags, values
+
+
+def _choices(sources, choices, required):
+    # WARNING: this is a private method for internal use only - do not call directly
+    # the same logic as validateChoices (and validateRequiredChoices) on top of the batch of strings
+    if scalar._sink is not None:
+        validator = scalar.validateRequiredChoices if required else scalar.validateChoices
+        return _batch(validator, sources, choices=choices)
+
+    flags, values = _strings(sources, 500, False, 'utf-8', True, True, None, False)
+
+    choices = _hashableChoices(choices)
+    choice_set = choices if isinstance(choices, scalar.ChoiceSet) else None
+
+    for index, value in enumerate(values):
+        if flags[index] and value:
+            if choice_set is not None:
+                match = choice_set.get(value)
+                if match is None:
+                    flags[index] = 0
+                else:
+                    values[index] = match
+            elif value not in choices:
+                flags[index] = 0
+        elif required:
+            flags[index] = 0
+
+    return flags, values
+
+
+def validateString(sources, max_length=500, newlines=False, encoding='utf-8', condense=True, convert_spaces=True,
+        normalize=None, fold_confusables=False):
+
+    return _strings(sources, max_length, newlines, encoding, condense, convert_spaces, normalize, fold_confusables)
+
+
+def validateRequiredString(sources, min_length=1, max_length=500, newlines=False, encoding='utf-8',
+        condense=True, convert_spaces=True, normalize=None, fold_confusables=False):
+
+    return _strings(sources, max_length, newlines, encoding, condense, convert_spaces, normalize, fold_confusables,
+        min_length=min_length)
+
+
+def validateText(sources, max_length=ONE_MB, newlines=True, encoding='utf-8', condense=True, convert_spaces=True,
+        normalize=None, fold_confusables=False):
+
+    return _strings(sources, max_length, newlines, encoding, condense, convert_spaces, normalize, fold_confusables)
+
+
+def validateRequiredText(sources, min_length=1, max_length=ONE_MB, newlines=True, encoding='utf-8',
+        condense=True, convert_spaces=True, normalize=None, fold_confusables=False):
+
+    return _strings(sources, max_length, newlines, encoding, condense, convert_spaces, normalize, fold_confusables,
+        min_length=min_length)
+
+
+def validateEmail(sources, blocked_domains=None):
+
+    return _batch(scalar.validateEmail, sources, blocked_domains=blocked_domains)
+
+
+def validateRequiredEmail(sources, blocked_domains=None):
+
+    return _batch(scalar.validateRequiredEmail, sources, blocked_domains=blocked_domains)
+
+
+def validatePhone(sources, extension_separators=None, extension_max_length=5):
+
+    if extension_separators:
+        # materialize once in case it's a generator or other single use iterable
+        extension_separators = tuple(extension_separators)
+
+    return _batch(scalar.validatePhone, sources, extension_separators=extension_separators,
+        extension_max_length=extension_max_length)
+
+
+def validateRequiredPhone(sources):
+
+    return _batch(scalar.validateRequiredPhone, sources)
+
+
+def validateUrl(sources, normalize=False):
+
+    return _batch(scalar.validateUrl, sources, normalize=normalize)
+
+
+def validateRequiredUrl(sources, normalize=False):
+
+    return _batch(scalar.validateRequiredUrl, sources, normalize=normalize)
+
+
+def validateUrlParts(sources, normalize=False):
+
+    return _batch(scalar.validateUrlParts, sources, normalize=normalize)
+
+
+def validateRequiredUrlParts(sources, normalize=False):
+
+    return _batch(scalar.validateRequiredUrlParts, sources, normalize=normalize)
+
+
+def validateChoices(sources, choices):
+
+    return _choices(sources, choices, False)
+
+
+def validateRequiredChoices(sources, choices):
+
+    return _choices(sources, choices, True)
+
+
+def validateBool(sources):
+
+    if scalar._sink is not None:
+        # go through the scalar validator so that instrumentation can see each call
+        return _batch(scalar.validateBool, sources)
+
+    values = [bool(source) for source in sources]
+
+    return bytearray([1]) * len(values), values
+
+
+def _numbers(convert, sources, min_amount, max_amount, required):
+    # WARNING: this is a private method for internal use only - do not call directly
+    # this is the same logic as validateInt and validateFloat inlined into a single loop
+    if scalar._sink is not None:
+        # go through the scalar validators so that instrumentation can see each call
+        name = ('validateRequired' if required else 'validate') + ('Int' if convert is int else 'Float')
+        return _batch(getattr(scalar, name), sources, min_amount=min_amount, max_amount=max_amount)
+
+    flags = bytearray()
+    values = []
+    append_flag = flags.append
+    append_value = values.append
+
+    for source in sources:
+        valid = True
+        if source:
+            try:
+                value = convert(source)
+            except ValueError:
+                value = None
+                valid = False
+
+            if valid and (min_amount > value or max_amount < value):
+                valid = False
+        else:
+            value = None
+
+        if required and valid and not value:
+            valid = False
+
+        append_flag(valid)
+        append_value(value)
+
+    return flags, values
+
+
+def validateInt(sources, min_amount=-INT_SIZE, max_amount=INT_SIZE - 1):
+
+    return _numbers(int, sources, min_amount, max_amount, False)
+
+
+def validateRequiredInt(sources, min_amount=-INT_SIZE, max_amount=INT_SIZE - 1):
+
+    return _numbers(int, sources, min_amount, max_amount, True)
+
+
+def validateFloat(sources, min_amount=-INT_SIZE, max_amount=INT_SIZE - 1):
+
+    return _numbers(float, sources, min_amount, max_amount, False)
+
+
+def validateRequiredFloat(sources, min_amount=-INT_SIZE, max_amount=INT_SIZE - 1):
+
+    return _numbers(float, sources, min_amount, max_amount, True)
+
+
+def _dates(sources, date_format, future_only, past_only, now, required, part=None):
+    # WARNING: this is a private method for internal use only - do not call directly
+    # the same logic as validateDateTime (and the date and time validators built on it) inlined into a single loop,
+    # with the fast parser for the format looked up once for the whole batch
+    # part is 'date' or 'time' to convert each value to just that part
+    now = _now(future_only, past_only, now)
+
+    if scalar._sink is not None:
+        # go through the scalar validators so that instrumentation can see each call
+        if part == 'time':
+            validator = scalar.validateRequiredTime if required else scalar.validateTime
+            return _batch(validator, sources, time_format=date_format)
+        if part == 'date':
+            validator = scalar.validateRequiredDate if required else scalar.validateDate
+        else:
+            validator = scalar.validateRequiredDateTime if required else scalar.validateDateTime
+        return _batch(validator, sources, date_format=date_format, future_only=future_only, past_only=past_only,
+            now=now)
+
+    parser = scalar._dateParser(date_format)
+    strptime = datetime.strptime
+
+    flags = bytearray()
+    values = []
+    append_flag = flags.append
+    append_value = values.append
+
+    for source in sources:
+        valid = True
+        if source:
+            value = parser(source) if parser else None
+
+            if value is None:
+                try:
+                    value = strptime(source, date_format)
+                except ValueError:
+                    valid = False
+
+            if valid and (future_only and value < now or past_only and value > now):
+                valid = False
+
+            if value and part:
+                value = value.date() if part == 'date' else value.time()
+        else:
+            value = None
+
+        if required and valid and not value:
+            valid = False
+
+        append_flag(valid)
+        append_value(value)
+
+    return flags, values
+
+
+def validateDateTime(sources, date_format="%Y-%m-%dT%H:%M", future_only=False, past_only=False, now=None):
+
+    return _dates(sources, date_format, future_only, past_only, now, False)
+
+
+def validateRequiredDateTime(sources, date_format="%Y-%m-%dT%H:%M", future_only=False, past_only=False, now=None):
+
+    return _dates(sources, date_format, future_only, past_only, now, True)
+
+
+def validateDate(sources, date_format="%Y-%m-%d", future_only=False, past_only=False, now=None):
+
+    return _dates(sources, date_format, future_only, past_only, now, False, 'date')
+
+
+def validateRequiredDate(sources, date_format="%Y-%m-%d", future_only=False, past_only=False, now=None):
+
+    return _dates(sources, date_format, future_only, past_only, now, True, 'date')
+
+
+def validateTime(sources, time_format="%H:%M"):
+
+    return _dates(sources, time_format, False, False, None, False, 'time')
+
+
+def validateRequiredTime(sources, time_format="%H:%M"):
+
+    return _dates(sources, time_format, False, False, None, True, 'time')
@@ -0,0 +1,123 @@
+# streaming validation of large CSV and JSONL files
+# rows are read lazily from a file object and validated one at a time against a Schema
+# so memory use stays constant no matter how large the file is
+
+# can also be run from the command line to check a file before importing it, e.g.:
+# python -m gae_validators.bulk contacts.csv --field email=validateRequiredEmail --field age=validateInt:min_amount=13
+
+import argparse
+import csv
+import io
+import json
+import sys
+
+import gae_validators
+from gae_validators import PY3, Schema
+
+
+def readCsv(fileobj, **kwargs):
+    # the first row is used as the header, any extra kwargs are passed to csv.DictReader
+    for row in csv.DictReader(fileobj, **kwargs):
+        yield row
+
+
+def readJsonl(fileobj):
+    # each non-blank line should be a JSON object, anything else is passed along to be rejected
+    for line in fileobj:
+        line = line.strip()
+        if line:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+
+
+def validateRows(rows, schema, rejected=None):
+    # yields the validated values of each valid row
+    # each invalid row is instead passed to `rejected(number, row, errors)` if provided
+    # where number is the 1-based position of the row and errors is a list of failing field names
+    # rows that aren't mappings (e.g. a JSONL line that isn't an object) are rejected with an error of "row"
+    if not isinstance(schema, Schema):
+        schema = Schema(schema)
+
+    validate = schema.validate
+
+    for number, row in enumerate(rows, 1):
+        if hasattr(row, 'get'):
+            valid, values, errors = validate(row)
+        else:
+            valid, values, errors = False, None, ['row']
+
+        if valid:
+            yield values
+        elif rejected:
+            rejected(number, row, errors)
+
+
+def _parseField(spec):
+    # WARNING: this is a private method for internal use only - do not call directly
+    # turns "age=validateInt:min_amount=13,max_amount=120" into ("age", (validateInt, {...}))
+    name, _, validator_spec = spec.partition('=')
+    validator_name, _, params = validator_spec.partition(':')
+
+    validator = getattr(gae_validators, validator_name, None)
+    if not name or not validator_name.startswith('validate') or not callable(validator):
+        raise argparse.ArgumentTypeError('invalid field: ' + spec)
+
+    kwargs = {}
+    if params:
+        for param in params.split(','):
+            key, _, value = param.partition('=')
+            try:
+                kwargs[key] = json.loads(value)
+            except ValueError:
+                kwargs[key] = value
+
+    return name, (validator, kwargs)
+
+
+def _open(path):
+    # WARNING: this is a private method for internal use only - do not call directly
+    if path == '-':
+        return sys.stdin
+    if PY3:
+        return io.open(path, 'r', newline='', encoding='utf-8')
+    # the python 2 csv module only works on byte strings, which validateString will decode
+    return open(path, 'rb')
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog='python -m gae_validators.bulk',
+        description='Validate every row of a CSV or JSONL file and report the rejected ones.')
+    parser.add_argument('path', help='file to check, or - for stdin')
+    parser.add_argument('--field', action='append', type=_parseField, required=True, dest='fields',
+        help='column=validatorName[:param=value,...], can be given multiple times')
+    parser.add_argument('--format', choices=('csv', 'jsonl'),
+        help='defaults to jsonl for .jsonl and .json files and csv otherwise')
+    options = parser.parse_args(args)
+
+    file_format = options.format
+    if not file_format:
+        file_format = 'jsonl' if options.path.endswith(('.jsonl', '.json')) else 'csv'
+
+    counts = {'rejected': 0}
+
+    def rejected(number, row, errors):
+        counts['rejected'] += 1
+        sys.stdout.write(json.dumps({'row': number, 'errors': errors}) + '\n')
+
+    fileobj = _open(options.path)
+    try:
+        rows = readCsv(fileobj) if file_format == 'csv' else readJsonl(fileobj)
+        accepted = sum(1 for values in validateRows(rows, Schema(options.fields), rejected=rejected))
+    finally:
+        if fileobj is not sys.stdin:
+            fileobj.close()
+
+    sys.stderr.write('%d rows accepted, %d rows rejected\n' % (accepted, counts['rejected']))
+
+    return 1 if counts['rejected'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,89 @@
+# opt-in memoization for validators, which are pure functions of their arguments
+# useful when the same values come in over and over (e.g. choices, common email domains, or phone formats)
+# so that repeated inputs skip the normalization and regex work entirely
+
+from collections import namedtuple, OrderedDict
+from functools import partial, wraps, WRAPPER_ASSIGNMENTS
+from threading import Lock
+
+from gae_validators import validateDateTime, validateRequiredDateTime, validateDate, validateRequiredDate
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+# these compare against the current time when future_only or past_only are set, so those calls are never cached
+TIME_DEPENDENT = (validateDateTime, validateRequiredDateTime, validateDate, validateRequiredDate)
+
+
+def memoize(validator=None, maxsize=1024):
+    # can be used directly, e.g. `validateEmail = memoize(validateEmail, maxsize=4096)`, or as a decorator
+    # the least recently used result is evicted once there are more than maxsize
+    # it's safe to share between threads, so one memoized validator can be used process-wide
+    # calls with unhashable arguments (like a list of choices) are passed straight through
+    if validator is None:
+        return lambda validator: memoize(validator, maxsize=maxsize)
+
+    # a partial (like the ones Schema binds) is unwrapped to find the validator and any parameters bound to it
+    func = validator
+    keywords = {}
+    bound_args = ()
+    while True:
+        func = getattr(func, '__wrapped__', func)
+        if not isinstance(func, partial):
+            break
+        # keywords bound on the outside take precedence over ones bound further in
+        keywords = dict(func.keywords or {}, **keywords)
+        bound_args = func.args + bound_args
+        func = func.func
+
+    time_dependent = func in TIME_DEPENDENT
+    # bound positional parameters shift the positions of the rest, so those aren't worth working out either
+    never_cache = time_dependent and bool(keywords.get('future_only') or keywords.get('past_only') or bound_args)
+    cache = OrderedDict()
+    lock = Lock()
+    stats = {'hits': 0, 'misses': 0}
+
+    # on Python 2 a partial doesn't have a name or module to copy
+    @wraps(validator, assigned=[attr for attr in WRAPPER_ASSIGNMENTS if hasattr(validator, attr)])
+    def wrapper(source, *args, **kwargs):
+        # future_only and past_only are the third and fourth positional parameters of all the date validators
+        if never_cache or time_dependent and (kwargs.get('future_only') or kwargs.get('past_only') or any(args[1:3])):
+            return validator(source, *args, **kwargs)
+
+        try:
+            # the type is part of the key because e.g. True == 1 but validateString treats them differently
+            key = (type(source), source, args, tuple(sorted(kwargs.items())))
+            hash(key)
+        except TypeError:
+            return validator(source, *args, **kwargs)
+
+        with lock:
+            if key in cache:
+                # move to the end to mark it as most recently used
+                result = cache.pop(key)
+                cache[key] = result
+                stats['hits'] += 1
+                return result
+
+        result = validator(source, *args, **kwargs)
+
+        with lock:
+            stats['misses'] += 1
+            cache[key] = result
+            if len(cache) > maxsize:
+                cache.popitem(last=False)
+
+        return result
+
+    def cacheInfo():
+        with lock:
+            return CacheInfo(stats['hits'], stats['misses'], maxsize, len(cache))
+
+    def cacheClear():
+        with lock:
+            cache.clear()
+            stats['hits'] = stats['misses'] = 0
+
+    wrapper.cacheInfo = cacheInfo
+    wrapper.cacheClear = cacheClear
+
+    return wrapper
@@ -0,0 +1,419 @@
+# columnar validation of large imports (like CSV columns) using numpy
+# numpy is an optional dependency (`pip install gae_validators[columns]`) that's only imported once these are used
+
+# each validator takes a sequence or numpy array of strings and returns a `(valid, values)` tuple
+# where valid is a boolean numpy array and values is a numpy masked array
+# masked values are the ones the scalar validator returns as None (e.g. empty strings)
+# strings in the common formats are parsed with vectorized operations on their code points
+# anything else falls back to the scalar validator, so the results always match calling it on each value
+
+from gae_validators import DATE_DIRECTIVES, INT_SIZE, PY3, validateDate, validateDateTime, validateFloat, validateInt
+from gae_validators import batch
+
+if PY3:
+    unicode = str
+
+# the most digits that are handled by the vectorized parsers
+# 18 digits always fit in an int64, and 15 digits always fit exactly in the mantissa of a float64
+# which makes dividing by an exact power of ten correctly rounded, just like float()
+INT_DIGITS = 18
+FLOAT_DIGITS = 15
+
+# the number of characters for each of the DATE_DIRECTIVES in the vectorized date parser
+# the fraction of a second is None because it can be anywhere from 1 to 6 digits
+DATE_WIDTHS = {'year': 4, 'month': 2, 'day': 2, 'hour': 2, 'minute': 2, 'second': 2, 'microsecond': None}
+
+# the same defaults that strptime uses for anything missing from the format
+DATE_DEFAULTS = {'year': 1900, 'month': 1, 'day': 1, 'hour': 0, 'minute': 0, 'second': 0, 'microsecond': 0}
+
+_np = None
+
+
+def _numpy():
+    # WARNING: this is a private method for internal use only - do not call directly
+    global _np
+    if _np is None:
+        import numpy
+        _np = numpy
+    return _np
+
+
+def _split(sources):
+    # WARNING: this is a private method for internal use only - do not call directly
+    # returns the sources as a list (or None if they're all in the string array), an array of the strings
+    # that can be parsed in bulk, and the position of each of those strings in the sources
+    np = _numpy()
+
+    if isinstance(sources, np.ndarray) and sources.dtype.kind == 'U':
+        strings = np.ascontiguousarray(sources.ravel())
+        return None, strings, np.arange(len(strings))
+
+    items = sources.tolist() if isinstance(sources, np.ndarray) else list(sources)
+
+    if set(map(type, items)) == set([unicode]):
+        strings = np.array(items, dtype=np.str_)
+        # numpy drops trailing null characters from strings, so any of those are left to the scalar validators
+        kept = np.char.str_len(strings) == np.fromiter(map(len, items), dtype=np.intp, count=len(items))
+        if kept.all():
+            return None, strings, np.arange(len(strings))
+        return items, strings[kept], np.flatnonzero(kept)
+
+    positions = [i for i, item in enumerate(items) if type(item) is unicode and item[-1:] != u'\x00']
+    strings = np.array([items[i] for i in positions], dtype=np.str_)
+    return items, strings, np.array(positions, dtype=np.intp)
+
+
+def _codes(strings):
+    # WARNING: this is a private method for internal use only - do not call directly
+    # a 2D view of the code points of each string without copying, padded with zeros up to the longest string
+    np = _numpy()
+    width = strings.dtype.itemsize // 4
+    if not width:
+        return np.zeros((len(strings), 0), dtype=np.uint32)
+    return strings.view(np.uint32).reshape(len(strings), width)
+
+
+def _parseDecimals(strings, max_digits, allow_point):
+    # WARNING: this is a private method for internal use only - do not call directly
+    # finds the strings that are an optional sign followed by 1 to max_digits digits (and optionally one point)
+    # returns which ones those are, their digits as an int64, how many digits follow the point,
+    # and whether they're negative, along with which strings are empty
+    # this works one column of characters at a time, since numpy is slow to reduce along short rows
+    np = _numpy()
+    codes = _codes(strings)
+    rows, width = codes.shape
+
+    ok = np.ones(rows, dtype=bool)
+    empty = np.ones(rows, dtype=bool)
+    negative = np.zeros(rows, dtype=bool)
+    count = np.zeros(rows, dtype=np.int8)
+    fraction = np.zeros(rows, dtype=np.int8)
+    mantissa = np.zeros(rows, dtype=np.int64)
+    after_point = np.zeros(rows, dtype=bool)
+    ended = np.zeros(rows, dtype=bool)
+
+    # the strings that can be parsed are short, so only the first few columns need to be read carefully
+    # and those are copied so that each column is contiguous, which makes everything below several times faster
+    limit = min(width, max_digits + 2)
+    for column, char in enumerate(np.ascontiguousarray(codes[:, :limit].T)):
+        padding = char == 0
+        # unsigned subtraction wraps around for anything below "0", so this is a single comparison
+        value = char - 48
+        digit = value < 10
+
+        # the padding has to be at the end, since a string can also contain null characters in the middle
+        ok &= padding | ~ended
+        ended |= padding
+        empty &= padding
+
+        allowed = digit | padding
+        if column == 0:
+            negative = char == 45
+            # a plus or minus sign is only allowed at the start
+            allowed |= negative | (char == 43)
+        if allow_point:
+            point = char == 46
+            # only one point is allowed
+            ok &= ~(point & after_point)
+            after_point |= point
+            allowed |= point
+            fraction += digit & after_point
+
+        ok &= allowed
+        count += digit
+        # updated in place, and only where there's a digit
+        np.multiply(mantissa, 10, out=mantissa, where=digit)
+        np.add(mantissa, value, out=mantissa, where=digit)
+
+    if width > limit:
+        # anything past the limit is too long to parse here
+        longer = codes[:, limit:].any(axis=1)
+        ok &= ~longer
+        empty &= ~longer
+
+    ok &= (count > 0) & (count <= max_digits)
+    return ok, mantissa, fraction, negative, empty
+
+
+def _remaining(items, strings, positions, handled):
+    # WARNING: this is a private method for internal use only - do not call directly
+    # the `(position, source)` of everything that wasn't handled in bulk, which goes to the scalar validator
+    np = _numpy()
+    slow = ~handled
+    remaining = list(zip(positions[slow].tolist(), strings[slow].tolist()))
+    if items is not None:
+        others = np.ones(len(items), dtype=bool)
+        others[positions] = False
+        remaining.extend((i, items[i]) for i in np.flatnonzero(others).tolist())
+    return remaining
+
+
+def _validateColumn(sources, validator, dtype, parse, min_amount, max_amount, required):
+    # WARNING: this is a private method for internal use only - do not call directly
+    # combines the vectorized results with the scalar validator for everything else
+    np = _numpy()
+
+    items, strings, positions = _split(sources)
+    ok, parsed, empty = parse(strings)
+
+    size = len(strings) if items is None else len(items)
+    values = np.zeros(size, dtype=dtype)
+    masked = np.zeros(size, dtype=bool)
+    valid = np.ones(size, dtype=bool)
+
+    fast = positions[ok]
+    values[fast] = parsed[ok]
+    valid[fast] = (parsed[ok] >= min_amount) & (parsed[ok] <= max_amount)
+
+    # empty strings are falsy, so they're None and valid just like with the scalar validators
+    masked[positions[empty]] = True
+
+    for i, source in _remaining(items, strings, positions, ok | empty):
+        valid[i], value = validator(source, min_amount=min_amount, max_amount=max_amount)
+        if value is None:
+            masked[i] = True
+        else:
+            try:
+                values[i] = value
+            except OverflowError:
+                # too large for the array, which means it was also out of range
+                masked[i] = True
+
+    if required:
+        valid &= ~masked & (values != 0)
+
+    return valid, np.ma.MaskedArray(values, mask=masked)
+
+
+def _parseInts(strings):
+    # WARNING: this is a private method for internal use only - do not call directly
+    np = _numpy()
+    ok, mantissa, fraction, negative, empty = _parseDecimals(strings, INT_DIGITS, False)
+    return ok, np.where(negative, -mantissa, mantissa), empty
+
+
+def _parseFloats(strings):
+    # WARNING: this is a private method for internal use only - do not call directly
+    np = _numpy()
+    ok, mantissa, fraction, negative, empty = _parseDecimals(strings, FLOAT_DIGITS, True)
+    values = mantissa / np.power(10.0, fraction)
+    return ok, np.where(negative, -values, values), empty
+
+
+def _checkIntRange(min_amount, max_amount):
+    # WARNING: this is a private method for internal use only - do not call directly
+    # so that every valid value fits in the int64 array
+    if min_amount < -INT_SIZE or max_amount > INT_SIZE - 1:
+        raise ValueError('min_amount and max_amount have to fit in an int64')
+
+
+def validateIntColumn(sources, min_amount=-INT_SIZE, max_amount=INT_SIZE - 1):
+    # values is an int64 masked array, so min_amount and max_amount have to fit in an int64
+    # invalid numbers that don't fit are masked
+    _checkIntRange(min_amount, max_amount)
+
+    return _validateColumn(sources, validateInt, _numpy().int64, _parseInts, min_amount, max_amount, False)
+
+
+def validateRequiredIntColumn(sources, min_amount=-INT_SIZE, max_amount=INT_SIZE - 1):
+    _checkIntRange(min_amount, max_amount)
+
+    return _validateColumn(sources, validateInt, _numpy().int64, _parseInts, min_amount, max_amount, True)
+
+
+def validateFloatColumn(sources, min_amount=-INT_SIZE, max_amount=INT_SIZE - 1):
+    # values is a float64 masked array
+
+    return _validateColumn(sources, validateFloat, _numpy().float64, _parseFloats, min_amount, max_amount, False)
+
+
+def validateRequiredFloatColumn(sources, min_amount=-INT_SIZE, max_amount=INT_SIZE - 1):
+
+    return _validateColumn(sources, validateFloat, _numpy().float64, _parseFloats, min_amount, max_amount, True)
+
+
+def _dateLayout(date_format):
+    # WARNING: this is a private method for internal use only - do not call directly
+    # returns a list of `(name, width)` for each field in the format, where the name is None for a literal character
+    # (and the width is that character), or None if the format can't be parsed in bulk
+    # these are the same formats that the scalar validators parse without strptime
+    layout = []
+    names = []
+    directive = False
+    for char in date_format:
+        if directive:
+            directive = False
+            if char not in DATE_DIRECTIVES or DATE_DIRECTIVES[char][0] in names:
+                return None
+            name = DATE_DIRECTIVES[char][0]
+            names.append(name)
+            layout.append((name, DATE_WIDTHS[name]))
+        elif char == '%':
+            directive = True
+        else:
+            layout.append((None, char))
+
+    if not names or directive:
+        return None
+
+    return layout
+
+
+def _parseDateGroup(codes, layout, fraction_width):
+    # WARNING: this is a private method for internal use only - do not call directly
+    # parses strings that are all the same length, so every field is at the same position in each of them
+    np = _numpy()
+    rows = len(codes)
+    columns = np.ascontiguousarray(codes.T)
+
+    ok = np.ones(rows, dtype=bool)
+    fields = {}
+    position = 0
+    for name, width in layout:
+        if name is None:
+            ok &= columns[position] == ord(width)
+            position += 1
+            continue
+
+        if width is None:
+            width = fraction_width
+
+        value = np.zeros(rows, dtype=np.int64)
+        for char in columns[position:position + width]:
+            # unsigned subtraction wraps around for anything below "0", so this is a single comparison
+            digit = char - 48
+            ok &= digit < 10
+            value *= 10
+            value += digit
+
+        if name == 'microsecond':
+            # like strptime this is a fraction of a second, so "5" means 500000
+            value *= 10 ** (6 - width)
+
+        fields[name] = value
+        position += width
+
+    for name, default in DATE_DEFAULTS.items():
+        if name not in fields:
+            fields[name] = np.full(rows, default, dtype=np.int64)
+
+    year, month, day = fields['year'], fields['month'], fields['day']
+    hour, minute, second = fields['hour'], fields['minute'], fields['second']
+
+    ok &= (year >= 1) & (month >= 1) & (month <= 12) & (day >= 1) & (hour < 24) & (minute < 60) & (second < 60)
+
+    # anything that isn't valid so far could be any number, so it's replaced to keep the date math in range
+    year = np.where(ok, year, 1970)
+    month = np.where(ok, month, 1)
+    months = (year - 1970).astype('datetime64[Y]').astype('datetime64[M]') + (month - 1)
+    days = months.astype('datetime64[D]')
+    ok &= day <= ((months + 1).astype('datetime64[D]') - days).astype(np.int64)
+
+    day = np.where(ok, day, 1)
+    seconds = (np.where(ok, hour, 0) * 60 + np.where(ok, minute, 0)) * 60 + np.where(ok, second, 0)
+    microseconds = seconds * 1000000 + np.where(ok, fields['microsecond'], 0)
+
+    values = (days + (day - 1).astype('timedelta64[D]')).astype('datetime64[us]')
+    values += microseconds.astype('timedelta64[us]')
+
+    return ok, values
+
+
+def _parseDates(strings, lengths, layout):
+    # WARNING: this is a private method for internal use only - do not call directly
+    # groups the strings by length, since the only variable width field is the fraction of a second
+    np = _numpy()
+    codes = _codes(strings)
+
+    ok = np.zeros(len(strings), dtype=bool)
+    values = np.full(len(strings), 'NaT', dtype='datetime64[us]')
+
+    fixed = sum(1 if name is None else width or 0 for name, width in layout)
+    fraction_widths = range(1, 7) if ('microsecond', None) in layout else [0]
+
+    for fraction_width in fraction_widths:
+        length = fixed + fraction_width
+        group = lengths == length
+        if not group.any():
+            continue
+        if group.all():
+            # usually every string is in the same format, so there's no need to copy them out first
+            ok, values = _parseDateGroup(codes[:, :length], layout, fraction_width)
+        else:
+            ok[group], values[group] = _parseDateGroup(codes[group, :length], layout, fraction_width)
+
+    return ok, values
+
+
+def _validateDateColumn(sources, validator, unit, date_format, future_only, past_only, now, required):
+    # WARNING: this is a private method for internal use only - do not call directly
+    # combines the vectorized results with the scalar validator for everything else
+    np = _numpy()
+    now = batch._now(future_only, past_only, now)
+
+    items, strings, positions = _split(sources)
+    lengths = np.char.str_len(strings)
+    empty = lengths == 0
+
+    layout = _dateLayout(date_format)
+    if layout:
+        ok, parsed = _parseDates(strings, lengths, layout)
+    else:
+        ok = np.zeros(len(strings), dtype=bool)
+
+    size = len(strings) if items is None else len(items)
+    dtype = 'datetime64[%s]' % unit
+    values = np.full(size, 'NaT', dtype=dtype)
+    masked = np.zeros(size, dtype=bool)
+    valid = np.ones(size, dtype=bool)
+
+    if ok.any():
+        fast = positions[ok]
+        parsed = parsed[ok]
+        # every value is compared against the same snapshot of the clock
+        if future_only:
+            valid[fast] = parsed >= np.datetime64(now, 'us')
+        elif past_only:
+            valid[fast] = parsed <= np.datetime64(now, 'us')
+        values[fast] = parsed.astype(dtype)
+
+    # empty strings are falsy, so they're None and valid just like with the scalar validators
+    masked[positions[empty]] = True
+
+    for i, source in _remaining(items, strings, positions, ok | empty):
+        valid[i], value = validator(source, date_format=date_format, future_only=future_only, past_only=past_only,
+            now=now)
+        if value is None:
+            masked[i] = True
+        else:
+            values[i] = value
+
+    if required:
+        valid &= ~masked
+
+    return valid, np.ma.MaskedArray(values, mask=masked)
+
+
+def validateDateTimeColumn(sources, date_format="%Y-%m-%dT%H:%M", future_only=False, past_only=False, now=None):
+    # values is a datetime64[us] masked array
+    # fixed width formats using only %Y, %m, %d, %H, %M, %S, and %f are parsed in bulk
+    # future_only and past_only compare every value against one snapshot of the clock, or now if it's passed in
+
+    return _validateDateColumn(sources, validateDateTime, 'us', date_format, future_only, past_only, now, False)
+
+
+def validateRequiredDateTimeColumn(sources, date_format="%Y-%m-%dT%H:%M", future_only=False, past_only=False,
+        now=None):
+
+    return _validateDateColumn(sources, validateDateTime, 'us', date_format, future_only, past_only, now, True)
+
+
+def validateDateColumn(sources, date_format="%Y-%m-%d", future_only=False, past_only=False, now=None):
+    # values is a datetime64[D] masked array
+
+    return _validateDateColumn(sources, validateDate, 'D', date_format, future_only, past_only, now, False)
+
+
+def validateRequiredDateColumn(sources, date_format="%Y-%m-%d", future_only=False, past_only=False, now=None):
+
+    return _validateDateColumn(sources, validateDate, 'D', date_format, future_only, past_only, now, True)
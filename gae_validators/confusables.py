@@ -0,0 +1,39 @@
+# the characters that validateString's fold_confusables replaces, which is a selection from the Unicode confusables
+# data (see https://www.unicode.org/reports/tr39/) of letters and punctuation that look just like ASCII ones
+# it only has characters that NFKC normalization leaves alone, since normalize='NFKC' already folds
+# things like fullwidth and mathematical letters, so the two are meant to be used together
+# this is only imported the first time fold_confusables is used
+
+# each pair is the characters and the ASCII characters they look like, in the same order
+CONFUSABLES = (
+    # Cyrillic
+    (u'\u0430\u0435\u043e\u0440\u0441\u0443\u0445\u0455\u0456\u0458\u04bb\u04cf\u0501\u051b\u051d', u'aeopcyxsijhldqw'),
+    (u'\u0410\u0412\u0415\u041a\u041c\u041d\u041e\u0420\u0421\u0422\u0425\u0405\u0406\u0408\u04ae', u'ABEKMHOPCTXSIJY'),
+    (u'\u04c0\u051a\u051c\u0417\u0431', u'lQW36'),
+    # Greek
+    (u'\u0391\u0392\u0395\u0396\u0397\u0399\u039a\u039c\u039d\u039f\u03a1\u03a4\u03a5\u03a7', u'ABEZHIKMNOPTYX'),
+    (u'\u03b1\u03b3\u03b9\u03bd\u03bf\u03c1\u03c5', u'ayivopu'),
+    # Armenian
+    (u'\u0570\u0578\u057d\u0581\u0566\u0585', u'hnugqo'),
+    # Latin
+    (u'\u0131\u0251\u0261\u0269\u01c0', u'iagil'),
+    # dashes, quotes, slashes, and colons
+    (u'\u2010\u2011\u2012\u2013\u2014\u2015\u2212', u'-------'),
+    (u'\u2018\u2019\u201a\u201b\u2032\u201c\u201d\u201e\u201f\u2033', u'\'\'\'\'\'"""""'),
+    (u'\u2044\u2215\u02d0\u2236', u'//::')
+)
+
+# characters that don't render at all, which are removed
+# zero width spaces aren't in UNICODE_SPACES since they aren't converted to a visible space
+INVISIBLE = u'\u00ad\u180e\u200b\u200c\u200d\u2060\ufeff'
+
+
+def buildTable():
+    # returns a table for unicode.translate that maps the code point of each character to its replacement
+    table = {}
+    for chars, ascii in CONFUSABLES:
+        for char, replacement in zip(chars, ascii):
+            table[ord(char)] = replacement
+    for char in INVISIBLE:
+        table[ord(char)] = None
+    return table
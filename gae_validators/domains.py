@@ -0,0 +1,182 @@
+# a compact on-disk index of email domains (e.g. disposable or blocked ones) for validateEmail's blocked_domains
+# the index is memory mapped rather than loaded, so opening one is instant
+# and every process on a host shares the same copy through the OS page cache
+# lookups go through a hash table in the file, so they only read a couple of entries
+
+# the index is built from a plain text list with one domain per line, e.g.:
+# python -m gae_validators.domains blocked.txt blocked.idx
+
+# the file format (all integers are unsigned 32 bit little endian):
+# the MAGIC bytes, the number of domains, the number of slots in the hash table,
+# an offset table with the start of each domain in the data plus the end of the last one,
+# the hash table, where each slot is either 0 for empty or one more than the number of a domain,
+# and then the data, which is every domain concatenated in sorted order
+# the hash table uses linear probing starting from the crc32 of a domain, and is never more than half full
+
+import argparse
+import io
+import mmap
+import os
+from struct import pack, unpack_from
+import sys
+from zlib import crc32
+
+MAGIC = b'GVDOMAIN1\n'
+
+_HEADER_SIZE = len(MAGIC) + 8
+
+
+def _domainKey(domain):
+    # WARNING: this is a private method for internal use only - do not call directly
+    # the form domains are stored in, which is lowercase ASCII bytes
+    domain = domain.strip().lower()
+    try:
+        return domain.encode('ascii')
+    except UnicodeError:
+        # internationalized domains are stored in their ASCII form, just like validateEmail checks them
+        return domain.encode('idna')
+
+
+def buildIndex(domains, path):
+    # domains is an iterable of domain names, which can also be written as "*.example.com" or ".example.com"
+    # blank lines and comments starting with # are skipped
+    # the index is written to a temporary file that then replaces any existing one
+    # so processes that already have the old one open keep using it safely
+    keys = set()
+    for domain in domains:
+        domain = domain.strip()
+        if not domain or domain.startswith('#'):
+            continue
+        if domain.startswith('*.'):
+            domain = domain[2:]
+        domain = domain.strip('.')
+        if not domain:
+            continue
+        try:
+            keys.add(_domainKey(domain))
+        except UnicodeError:
+            raise ValueError('invalid domain: ' + domain)
+
+    keys = sorted(keys)
+
+    offsets = [0]
+    for key in keys:
+        offsets.append(offsets[-1] + len(key))
+
+    size = 1
+    while size < len(keys) * 2:
+        size *= 2
+    mask = size - 1
+
+    slots = [0] * size
+    for number, key in enumerate(keys):
+        slot = crc32(key) & mask
+        while slots[slot]:
+            slot = (slot + 1) & mask
+        slots[slot] = number + 1
+
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(pack('<2I', len(keys), size))
+        f.write(pack('<%dI' % len(offsets), *offsets))
+        f.write(pack('<%dI' % size, *slots))
+        for key in keys:
+            f.write(key)
+
+    getattr(os, 'replace', os.rename)(temp_path, path)
+
+    return len(keys)
+
+
+def buildIndexFromFile(source, path, encoding='utf-8'):
+    # source is a path or a file object with one domain per line, which is read lazily
+    if hasattr(source, 'read'):
+        return buildIndex(source, path)
+
+    with io.open(source, encoding=encoding) as f:
+        return buildIndex(f, path)
+
+
+class DomainIndex(object):
+    # opens an index built by buildIndex, e.g.:
+    # BLOCKED_DOMAINS = DomainIndex('blocked.idx')
+    # valid, value = validateEmail(source, blocked_domains=BLOCKED_DOMAINS)
+    # `domain in index` only matches exactly, and validateEmail checks each parent domain too
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            # the mapping stays valid after the file is closed
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            self._mmap.close()
+            raise ValueError('not a domain index: ' + path)
+
+        self._count, size = unpack_from('<2I', self._mmap, len(MAGIC))
+        self._mask = size - 1
+        self._slots = _HEADER_SIZE + (self._count + 1) * 4
+        self._data = self._slots + size * 4
+
+    def __contains__(self, domain):
+        try:
+            key = _domainKey(domain)
+        except UnicodeError:
+            return False
+
+        index = self._mmap
+        mask = self._mask
+        slot = crc32(key) & mask
+        while True:
+            number = unpack_from('<I', index, self._slots + slot * 4)[0]
+            if not number:
+                return False
+
+            start, end = unpack_from('<2I', index, _HEADER_SIZE + (number - 1) * 4)
+            if index[self._data + start:self._data + end] == key:
+                return True
+
+            slot = (slot + 1) & mask
+
+    def __iter__(self):
+        for i in range(self._count):
+            start, end = unpack_from('<2I', self._mmap, _HEADER_SIZE + i * 4)
+            yield self._mmap[self._data + start:self._data + end].decode('ascii')
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog='python -m gae_validators.domains',
+        description='Build a domain index for validateEmail from a list of domains.')
+    parser.add_argument('source', help='text file with one domain per line, or - for stdin')
+    parser.add_argument('path', help='where to write the index')
+    parser.add_argument('--encoding', default='utf-8', help='encoding of the source file')
+    options = parser.parse_args(args)
+
+    try:
+        if options.source == '-':
+            count = buildIndex(io.open(sys.stdin.fileno(), encoding=options.encoding, closefd=False), options.path)
+        else:
+            count = buildIndexFromFile(options.source, options.path, encoding=options.encoding)
+    except ValueError as e:
+        sys.stderr.write(str(e) + '\n')
+        return 1
+
+    sys.stderr.write('%d domains written to %s\n' % (count, options.path))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
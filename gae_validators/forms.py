@@ -0,0 +1,343 @@
+# one pass validation of form bodies (urlencoded or multipart) against a Schema
+# the raw body is read a chunk at a time and each declared field is decoded and validated as soon as it ends
+# so it never goes through a MultiDict first, fields that aren't in the schema are skipped without being decoded,
+# and a field that's longer than its validator allows is rejected as soon as it goes past that length
+# instead of after all of it has been read
+
+# the length limit of a field comes from the validator's max_length (including one bound with a tuple or partial),
+# or the 500 characters of validateString for validators like validateEmail that use it
+# any other validator is limited to max_field_size characters
+# fields bound with normalize or fold_confusables aren't limited early, since those can shorten the text a lot
+# only characters that aren't whitespace are counted while reading, since validateString could condense or strip
+# the rest, so a field is never rejected early that the validator would have accepted
+
+import codecs
+from functools import partial
+import io
+import re
+
+from gae_validators import (ONE_MB, PY3, Schema, validateChoices, validateEmail, validatePhone, validateRequiredChoices,
+    validateRequiredEmail, validateRequiredPhone, validateRequiredString, validateRequiredText, validateRequiredUrl,
+    validateRequiredUrlParts, validateString, validateText, validateUrl, validateUrlParts)
+
+if PY3:
+    from urllib.parse import unquote_to_bytes
+    unicode = str
+else:
+    from urllib import unquote as unquote_to_bytes
+
+CHUNK_SIZE = 2 ** 16
+
+URLENCODED = 'application/x-www-form-urlencoded'
+MULTIPART = 'multipart/form-data'
+
+# longer names can't be in a schema, so they're skipped rather than buffered
+MAX_NAME_SIZE = 1024
+# the most header bytes a multipart part can have before the body is rejected
+MAX_HEADER_SIZE = 16 * 1024
+
+NAME_END = re.compile(b'[=&]')
+DISPOSITION_NAME = re.compile(br';\s*name\s*=\s*(?:"((?:[^"\\]|\\.)*)"|([^;\s]*))', re.IGNORECASE)
+
+# the length limits of validators that don't have a max_length parameter themselves
+MAX_LENGTHS = {
+    validateString: 500,
+    validateRequiredString: 500,
+    validateText: ONE_MB,
+    validateRequiredText: ONE_MB,
+    validateEmail: 500,
+    validateRequiredEmail: 500,
+    validatePhone: 500,
+    validateRequiredPhone: 500,
+    validateUrl: 500,
+    validateRequiredUrl: 500,
+    validateUrlParts: 500,
+    validateRequiredUrlParts: 500,
+    validateChoices: 500,
+    validateRequiredChoices: 500
+}
+
+
+def _maxLength(validator, default):
+    # WARNING: this is a private method for internal use only - do not call directly
+    keywords = {}
+    while isinstance(validator, partial):
+        # keywords bound on the outside take precedence over ones bound further in
+        keywords = dict(validator.keywords or {}, **keywords)
+        validator = validator.func
+
+    # normalizing and folding confusables can shorten the text by more than its whitespace
+    # (e.g. by composing characters or removing invisible ones), so those fields can't be rejected early
+    if keywords.get('normalize') or keywords.get('fold_confusables'):
+        return None
+
+    if 'max_length' in keywords:
+        return keywords['max_length']
+
+    validator = getattr(validator, '__wrapped__', validator)
+    return MAX_LENGTHS.get(validator, default)
+
+
+def _parseContentType(content_type):
+    # WARNING: this is a private method for internal use only - do not call directly
+    # returns the media type and a dict of its parameters
+    parts = content_type.split(';')
+    params = {}
+    for part in parts[1:]:
+        key, equals, value = part.partition('=')
+        if equals:
+            value = value.strip()
+            if len(value) > 1 and value[0] == value[-1] == '"':
+                value = value[1:-1]
+            params[key.strip().lower()] = value
+    return parts[0].strip().lower(), params
+
+
+class _Field(object):
+    # WARNING: this is a private class for internal use only - do not use directly
+    # decodes one field a chunk at a time and keeps count of the characters that will survive normalizing
+
+    def __init__(self, name, validator, limit, encoding, quoted):
+        self.name = name
+        self.validator = validator
+        self.limit = limit
+        self.quoted = quoted
+        self.decoder = codecs.getincrementaldecoder(encoding)()
+        self.parts = []
+        self.count = 0
+        self.pending = b''
+
+    def feed(self, data, final=False):
+        if self.parts is None:
+            # already rejected, so the rest is skipped
+            return
+
+        if self.quoted:
+            data = self.pending + data
+            self.pending = b''
+            if not final:
+                # a percent escape split across chunks is held back until the rest of it arrives
+                cut = data.rfind(b'%', -2)
+                if cut != -1:
+                    self.pending = data[cut:]
+                    data = data[:cut]
+            data = unquote_to_bytes(data.replace(b'+', b' '))
+
+        try:
+            text = self.decoder.decode(data, final)
+        except UnicodeDecodeError:
+            self.parts = None
+            return
+
+        if self.limit is not None:
+            self.count += len(u''.join(text.split()))
+            if self.count > self.limit:
+                self.parts = None
+                return
+
+        self.parts.append(text)
+
+    def result(self):
+        self.feed(b'', final=True)
+        if self.parts is None:
+            return False, None
+        return self.validator(u''.join(self.parts))
+
+
+class _Form(object):
+    # WARNING: this is a private class for internal use only - do not use directly
+    # the parsers for each kind of body, which share the fields being looked for and the results so far
+
+    def __init__(self, stream, schema, encoding, max_field_size, chunk_size):
+        self.stream = stream
+        self.encoding = encoding
+        self.chunk_size = chunk_size
+        self.limits = dict((name, _maxLength(validator, max_field_size)) for name, validator in schema.fields)
+        self.validators = schema.validators
+        self.results = {}
+        # the name of the field being read, for reporting where a malformed body went wrong
+        self.name = ''
+
+    def field(self, raw_name, quoted):
+        # returns a new _Field if the name is in the schema, or None for one to skip
+        if quoted:
+            raw_name = unquote_to_bytes(raw_name.replace(b'+', b' '))
+        try:
+            name = raw_name.decode(self.encoding)
+        except UnicodeDecodeError:
+            return None
+
+        self.name = name
+        validator = self.validators.get(name)
+        if validator is None:
+            return None
+        return _Field(name, validator, self.limits[name], self.encoding, quoted)
+
+    def finish(self, field):
+        if field is not None:
+            # like a MultiDict, the last of any repeated field is the one used
+            self.results[field.name] = field.result()
+        self.name = ''
+
+    def urlencoded(self):
+        name = b''
+        field = None
+        in_value = False
+
+        while True:
+            chunk = self.stream.read(self.chunk_size)
+            if not chunk:
+                break
+
+            position = 0
+            while position < len(chunk):
+                if in_value:
+                    end = chunk.find(b'&', position)
+                    if end == -1:
+                        if field is not None:
+                            field.feed(chunk[position:])
+                        break
+                    if field is not None:
+                        field.feed(chunk[position:end])
+                    self.finish(field)
+                    in_value = False
+                    position = end + 1
+                else:
+                    match = NAME_END.search(chunk, position)
+                    if match is None:
+                        if len(name) <= MAX_NAME_SIZE:
+                            name += chunk[position:]
+                        break
+
+                    if len(name) <= MAX_NAME_SIZE:
+                        name += chunk[position:match.start()]
+                    field = name and len(name) <= MAX_NAME_SIZE and self.field(name, True) or None
+                    if match.group() == b'=':
+                        in_value = True
+                    elif name:
+                        # a name without any "=" is a blank value
+                        self.finish(field)
+                    name = b''
+                    position = match.end()
+
+        if in_value:
+            self.finish(field)
+        elif name and len(name) <= MAX_NAME_SIZE:
+            self.finish(self.field(name, True))
+
+    def read(self, buffer):
+        # WARNING: raises a ValueError at the end of the body, since a multipart body should end with a boundary
+        data = self.stream.read(self.chunk_size)
+        if not data:
+            raise ValueError('Unexpected end of the body')
+        return buffer + data
+
+    def multipart(self, boundary):
+        delimiter = b'\r\n--' + boundary
+        keep = len(delimiter) - 1
+        # the first boundary doesn't need to be on its own line
+        buffer = b'\r\n'
+        field = None
+        preamble = True
+
+        while True:
+            index = buffer.find(delimiter)
+            if index == -1:
+                # everything but what could be the start of a boundary is done with
+                if len(buffer) > keep:
+                    if field is not None:
+                        field.feed(buffer[:-keep])
+                    buffer = buffer[-keep:]
+                buffer = self.read(buffer)
+                continue
+
+            if field is not None:
+                field.feed(buffer[:index])
+            if not preamble:
+                self.finish(field)
+            preamble = False
+            field = None
+
+            buffer = buffer[index + len(delimiter):]
+            while len(buffer) < 2:
+                buffer = self.read(buffer)
+            if buffer.startswith(b'--'):
+                # the closing boundary, after which anything else is ignored
+                return
+
+            end = buffer.find(b'\r\n\r\n')
+            while end == -1:
+                if len(buffer) > MAX_HEADER_SIZE:
+                    raise ValueError('Part headers are too long')
+                buffer = self.read(buffer)
+                end = buffer.find(b'\r\n\r\n')
+
+            lines = buffer[:end].split(b'\r\n')
+            buffer = buffer[end + 4:]
+            if lines[0].strip():
+                raise ValueError('Malformed boundary')
+
+            for line in lines[1:]:
+                header, colon, value = line.partition(b':')
+                if header.strip().lower() == b'content-disposition':
+                    match = DISPOSITION_NAME.search(value)
+                    if match:
+                        if match.group(1) is not None:
+                            raw_name = re.sub(br'\\(.)', br'\1', match.group(1))
+                        else:
+                            raw_name = match.group(2)
+                        field = self.field(raw_name, False)
+                    break
+
+
+def validateForm(source, schema, content_type=None, encoding='utf-8', max_field_size=ONE_MB, chunk_size=CHUNK_SIZE):
+    # source is a file object reading bytes (like request.body_file) or bytes
+    # schema is a Schema or a dict of field names to validators
+    # content_type is the whole Content-Type header, including the boundary for multipart bodies
+    # and a charset, which takes the place of encoding, and defaults to urlencoded
+    # returns a `(valid, values, errors)` tuple just like a Schema
+    # if the body is malformed then values is None, with an error for the field being read when it went wrong
+    # an unsupported content type or a multipart one without a boundary raises a ValueError
+    if isinstance(schema, dict):
+        schema = Schema(schema)
+
+    media_type, params = _parseContentType(content_type or URLENCODED)
+    if media_type not in (URLENCODED, MULTIPART):
+        raise ValueError('Unsupported content type: ' + media_type)
+    encoding = params.get('charset') or encoding
+
+    if isinstance(source, unicode):
+        source = source.encode(encoding)
+    if not hasattr(source, 'read'):
+        source = io.BytesIO(source)
+
+    if media_type == MULTIPART:
+        boundary = params.get('boundary')
+        if not boundary:
+            raise ValueError('A multipart body needs a boundary')
+        try:
+            boundary = boundary.encode('ascii')
+        except UnicodeError:
+            raise ValueError('Invalid boundary: ' + boundary)
+
+    form = _Form(source, schema, encoding, max_field_size, chunk_size)
+    try:
+        if media_type == URLENCODED:
+            form.urlencoded()
+        else:
+            form.multipart(boundary)
+    except ValueError:
+        return False, None, [form.name]
+
+    values = {}
+    errors = []
+    for name, validator in schema.fields:
+        if name in form.results:
+            valid, value = form.results[name]
+        else:
+            valid, value = validator(None)
+        values[name] = value
+        if not valid:
+            errors.append(name)
+
+    return not errors, values, errors
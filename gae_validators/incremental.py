@@ -0,0 +1,147 @@
+# incremental validation of long text that changes a little at a time, like an autosaved document
+# the text is kept in chunks along with the normalized version of each one
+# so an edit only normalizes and checks the chunks it touches, rather than all of the text again
+# the result is always the same as calling validateText (or validateRequiredText with a min_length) on the whole text
+
+import codecs
+
+from gae_validators import CHUNKED_ENCODINGS, ONE_MB, PY3, _ENCODING_CHECKS, _decode, _encodingCheck, _normalize
+
+if PY3:
+    unicode = str
+
+# small enough that normalizing a chunk is cheap, but large enough that there aren't many chunks to put together
+CHUNK_SIZE = 4096
+
+
+class IncrementalText(object):
+    # takes the same parameters as validateText, plus min_length to match validateRequiredText
+    # edit replaces the text between start and end (positions in the original text, like a slice) and returns
+    # the `(valid, value)` tuple for the new text, e.g.:
+    # text = IncrementalText(body)
+    # valid, value = text.edit(10, 15, 'new words')
+    # encodings that are checked a character at a time (like utf-8) are only checked for the new text on Python 3
+    # while any others have to check all of the text again after each edit
+
+    def __init__(self, source='', min_length=0, max_length=ONE_MB, newlines=True, encoding='utf-8',
+            condense=True, convert_spaces=True, chunk_size=CHUNK_SIZE):
+        self.min_length = min_length
+        self.max_length = max_length
+        self.newlines = newlines
+        self.encoding = encoding
+        self.condense = condense
+        self.convert_spaces = convert_spaces
+        self.chunk_size = chunk_size
+
+        self._check = _ENCODING_CHECKS.get(encoding) or _encodingCheck(encoding)
+        name = codecs.lookup(encoding).name
+        self._chunked_check = name == 'ascii' or (PY3 and name in CHUNKED_ENCODINGS)
+
+        # the original text, its normalized version before stripping, and whether it can be encoded, for each chunk
+        self._chunks = []
+        self._normalized = []
+        self._encodes = []
+        self._splice(0, 0, self._text(source))
+
+    def _text(self, source):
+        # WARNING: this is a private method for internal use only - do not call directly
+        if source is None:
+            return u''
+        if type(source) is not unicode:
+            text = _decode(source, self.encoding)
+            if text is None:
+                raise ValueError('The text could not be decoded with the encoding.')
+            return text
+        return source
+
+    def _splice(self, first, last, text):
+        # WARNING: this is a private method for internal use only - do not call directly
+        # replaces the chunks from first up to last with new chunks of text
+        size = self.chunk_size
+        chunks = [text[i:i + size] for i in range(0, len(text), size)]
+        normalized = [self._normalizeChunk(chunk) for chunk in chunks]
+        encodes = [self._chunked_check and self._check(chunk) for chunk in chunks]
+
+        self._chunks[first:last] = chunks
+        self._normalized[first:last] = normalized
+        self._encodes[first:last] = encodes
+
+    def _normalizeChunk(self, chunk):
+        # WARNING: this is a private method for internal use only - do not call directly
+        # the same as _normalize without stripping, since a chunk's whitespace only gets stripped at either end
+        if not chunk:
+            return chunk
+        # a marker on either side stops strip from touching the chunk's own whitespace
+        return _normalize(u'.' + chunk + u'.', condense=self.condense, convert_spaces=self.convert_spaces)[1:-1]
+
+    @property
+    def source(self):
+        return u''.join(self._chunks)
+
+    def __len__(self):
+        return sum(len(chunk) for chunk in self._chunks)
+
+    def edit(self, start, end, text):
+        # positions are in characters of the original (not normalized) text
+        text = self._text(text)
+
+        offset = 0
+        first = last = None
+        for index, chunk in enumerate(self._chunks):
+            if first is None and start <= offset + len(chunk):
+                first = index
+                start_offset = offset
+            if end <= offset + len(chunk):
+                last = index
+                break
+            offset += len(chunk)
+
+        if start < 0 or end < start or (self._chunks and last is None):
+            raise ValueError('The edit is out of range.')
+
+        if not self._chunks:
+            if end:
+                raise ValueError('The edit is out of range.')
+            self._splice(0, 0, text)
+        else:
+            # the edited chunks are rebuilt from what's left of them on either side plus the new text
+            before = self._chunks[first][:start - start_offset]
+            after = self._chunks[last][end - offset:]
+            last += 1
+
+            # a small remainder is merged with the next chunk, so deletes don't leave lots of tiny chunks behind
+            if len(before) + len(text) + len(after) < self.chunk_size // 2 and last < len(self._chunks):
+                after += self._chunks[last]
+                last += 1
+
+            self._splice(first, last, before + text + after)
+
+        return self.validate()
+
+    def validate(self):
+        # returns the `(valid, value)` tuple for the current text
+        if self._chunked_check:
+            encodes = all(self._encodes)
+        else:
+            encodes = self._check(self.source)
+
+        if not encodes:
+            return False, u''
+
+        parts = []
+        space = False
+        for normalized in self._normalized:
+            # a run of spaces can cross from one chunk to the next, in which case it's condensed here
+            if space and self.condense and normalized[:1] == u' ':
+                normalized = normalized[1:]
+            if normalized:
+                parts.append(normalized)
+                space = normalized[-1] == u' '
+
+        value = u''.join(parts).strip()
+
+        valid = self.min_length <= len(value) <= self.max_length
+        if valid and not self.newlines and (u'\n' in value or u'\r' in value):
+            valid = False
+
+        return valid, value
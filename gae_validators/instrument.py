@@ -0,0 +1,157 @@
+# optional instrumentation to see which validators are called the most, how long they take, and why values fail
+# while enabled every validator in the package records its calls, latency, and input size to a sink
+# along with the reason for each rejection (e.g. "too long", "newline", "bad TLD", or "out of range")
+# when disabled the validators are restored to the originals, so it costs next to nothing to leave this available
+
+# e.g. to count what's going on in production:
+# sink = instrument.enable(instrument.MemorySink())
+# ...
+# sink.snapshot()['validateEmail']['reasons'] # {'bad TLD': 12, ...}
+
+from collections import Counter
+from functools import wraps
+import logging
+from threading import Lock
+import time
+
+import gae_validators
+
+_timer = getattr(time, 'perf_counter', time.time)
+
+# the original validators while instrumentation is enabled
+_originals = {}
+
+
+class Sink(object):
+    # the base class for sinks, which receive the measurements of every call while instrumentation is enabled
+    # a sink has to be safe to call from multiple threads if validators are used from multiple threads
+
+    def record(self, validator, elapsed, size, valid):
+        # called after each call to a validator with the time it took in seconds
+        # size is the length of the source or None if it doesn't have one
+        # note that validators which call other validators (e.g. validateEmail calls validateString)
+        # are recorded as well as the ones they call, so the elapsed time includes the inner calls
+        pass
+
+    def reject(self, validator, reason):
+        # called with a short description of why the named validator rejected a value, before it returns
+        pass
+
+
+def _bucket(amount):
+    # WARNING: this is a private method for internal use only - do not call directly
+    # the exclusive upper bound of the power of two bucket that the amount falls in, i.e. 1, 2, 4, 8...
+    return 1 << int(amount).bit_length()
+
+
+class MemorySink(Sink):
+    # keeps counts, log2 histograms of latency (in microseconds) and input size, and rejection reasons in memory
+
+    def __init__(self):
+        self._lock = Lock()
+        self._stats = {}
+
+    def _validatorStats(self, validator):
+        # WARNING: this is a private method for internal use only - do not call directly
+        stats = self._stats.get(validator)
+        if stats is None:
+            stats = self._stats[validator] = {'calls': 0, 'invalid': 0, 'latency': Counter(), 'sizes': Counter(),
+                'reasons': Counter()}
+        return stats
+
+    def record(self, validator, elapsed, size, valid):
+        with self._lock:
+            stats = self._validatorStats(validator)
+            stats['calls'] += 1
+            if not valid:
+                stats['invalid'] += 1
+            stats['latency'][_bucket(elapsed * 1000000)] += 1
+            if size is not None:
+                stats['sizes'][_bucket(size)] += 1
+
+    def reject(self, validator, reason):
+        with self._lock:
+            self._validatorStats(validator)['reasons'][reason] += 1
+
+    def snapshot(self):
+        # returns a copy of everything recorded so far as a dict of validator name to
+        # {'calls': int, 'invalid': int, 'latency': {...}, 'sizes': {...}, 'reasons': {...}}
+        # where each histogram maps the exclusive upper bound of a bucket to the number of calls in it
+        with self._lock:
+            return dict((validator, {
+                'calls': stats['calls'],
+                'invalid': stats['invalid'],
+                'latency': dict(stats['latency']),
+                'sizes': dict(stats['sizes']),
+                'reasons': dict(stats['reasons'])
+            }) for validator, stats in self._stats.items())
+
+    def clear(self):
+        with self._lock:
+            self._stats = {}
+
+
+class LoggingSink(Sink):
+    # writes every call and rejection to a logger, which is mostly useful while debugging
+    # since logging each call is much more expensive than the validation itself
+
+    def __init__(self, logger=None, level=logging.DEBUG):
+        self.logger = logger or logging.getLogger('gae_validators')
+        self.level = level
+
+    def record(self, validator, elapsed, size, valid):
+        self.logger.log(self.level, '%s %s in %.1fus (size %s)', validator, 'passed' if valid else 'failed',
+            elapsed * 1000000, size)
+
+    def reject(self, validator, reason):
+        self.logger.log(self.level, '%s rejected: %s', validator, reason)
+
+
+def _instrument(name, validator, sink):
+    # WARNING: this is a private method for internal use only - do not call directly
+    @wraps(validator)
+    def wrapper(source, *args, **kwargs):
+        start = _timer()
+        result = validator(source, *args, **kwargs)
+        elapsed = _timer() - start
+
+        try:
+            size = len(source)
+        except TypeError:
+            size = None
+
+        sink.record(name, elapsed, size, result[0])
+        return result
+
+    wrapper.__wrapped__ = validator
+    return wrapper
+
+
+def enable(sink):
+    # sends measurements of every validator in the package to the sink until disable is called, and returns the sink
+    # the validators are replaced in the module, so this covers calls through the module (e.g. by batch or bulk)
+    # and between validators, but not references that were imported before this was called
+    # e.g. `from gae_validators import validateEmail`, which will still record rejection reasons but not calls
+    disable()
+
+    for name in dir(gae_validators):
+        validator = getattr(gae_validators, name)
+        if name.startswith('validate') and callable(validator):
+            _originals[name] = validator
+            setattr(gae_validators, name, _instrument(name, validator, sink))
+
+    gae_validators._sink = sink
+    return sink
+
+
+def disable():
+    # restores the original validators and stops recording, it's safe to call this if not enabled
+    gae_validators._sink = None
+
+    for name, validator in _originals.items():
+        setattr(gae_validators, name, validator)
+    _originals.clear()
+
+
+def isEnabled():
+    return gae_validators._sink is not None
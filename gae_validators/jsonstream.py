@@ -0,0 +1,509 @@
+# streaming validation of JSON request bodies against a Schema
+# the body is parsed a chunk at a time and each value is validated as soon as it's read
+# so only the validated values of declared fields are ever built, and anything else is checked and skipped over
+# with iterJson, arrays of records (like thousands of contacts) are validated one record at a time
+# which means memory use depends on how deeply the JSON is nested rather than how large it is
+
+# a schema is a Schema or a dict of field names to specs, where a spec is any of:
+# a validator (or a tuple of `(validator, kwargs)`) for a string, number, boolean, or null
+# a nested Schema or dict for an object
+# a list with one spec in it for an array of those, e.g. `[validateEmail]` or `[{'email': validateEmail}]`
+# e.g. Schema({'name': validateRequiredString, 'contacts': [{'email': validateEmail, 'phone': validatePhone}]})
+
+# errors are reported as the path of each failing value, like "contacts.3.email"
+# a missing field is validated as None, just like with a Schema, while a missing array is empty
+# an object or array where a validator expects a single value is an error without being read
+# and if the JSON itself is malformed then validation stops with an error for the last path that was read
+
+import codecs
+import io
+import re
+from json.decoder import scanstring
+
+from gae_validators import PY3, Schema
+
+if PY3:
+    unicode = str
+
+CHUNK_SIZE = 2 ** 16
+
+# deeper JSON than this is rejected rather than risking running out of stack
+MAX_DEPTH = 64
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+WHITESPACE_CHARS = frozenset(' \t\n\r')
+NUMBER = re.compile(r'-?(?:0|[1-9][0-9]*)(\.[0-9]+)?([eE][-+]?[0-9]+)?')
+# the end of a string, without decoding it
+STRING_END = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+# the contents of a valid string up to its closing quote, without any control characters or unknown escapes
+VALID_STRING = re.compile(r'(?:[^"\\\x00-\x1f]|\\["\\/bfnrt]|\\u[0-9a-fA-F]{4})*"')
+# a whole object or array with only strings, numbers, and literals in it, which is most of them
+# so they can be checked and skipped with a single match
+_STRING = r'"(?:[^"\\\x00-\x1f]|\\["\\/bfnrt]|\\u[0-9a-fA-F]{4})*"'
+_SCALAR = (r'(?:' + _STRING + r'|-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?'
+    r'|true|false|null|NaN|-?Infinity)[ \t\n\r]*')
+_MEMBER = _STRING + r'[ \t\n\r]*:[ \t\n\r]*' + _SCALAR
+FLAT_CONTAINER = re.compile(r'\[[ \t\n\r]*(?:' + _SCALAR + r'(?:,[ \t\n\r]*' + _SCALAR + r')*)?\]'
+    r'|\{[ \t\n\r]*(?:' + _MEMBER + r'(?:,[ \t\n\r]*' + _MEMBER + r')*)?\}')
+
+LITERALS = (('true', True), ('false', False), ('null', None), ('NaN', float('nan')), ('Infinity', float('inf')),
+    ('-Infinity', float('-inf')))
+
+_OBJECT = 0
+_ARRAY = 1
+_VALUE = 2
+
+
+class _Stop(Exception):
+    # WARNING: this is a private class for internal use only - do not use directly
+    # raised to stop walking the JSON once max_errors is reached
+    pass
+
+
+def _compile(spec):
+    # WARNING: this is a private method for internal use only - do not call directly
+    # turns a spec into a `(kind, details)` tuple, where details is a dict of fields to compiled specs for objects,
+    # the compiled spec of each item for arrays, or the validator for everything else
+    if isinstance(spec, dict):
+        spec = Schema(spec)
+
+    if isinstance(spec, Schema):
+        return _OBJECT, dict((name, _compile(field)) for name, field in spec.fields)
+
+    if isinstance(spec, list):
+        if len(spec) != 1:
+            raise ValueError('An array spec must have exactly one item spec.')
+        return _ARRAY, _compile(spec[0])
+
+    if isinstance(spec, tuple):
+        validator, kwargs = spec
+        if kwargs:
+            from functools import partial
+            validator = partial(validator, **kwargs)
+        spec = validator
+
+    return _VALUE, spec
+
+
+def _pathName(path):
+    # WARNING: this is a private method for internal use only - do not call directly
+    return '.'.join(unicode(part) for part in path)
+
+
+class _Reader(object):
+    # WARNING: this is a private class for internal use only - do not use directly
+    # reads JSON tokens from a file object, bytes, or text while only holding on to the current chunk
+    # malformed JSON raises a ValueError
+
+    def __init__(self, source, chunk_size):
+        self.chunk_size = chunk_size
+        self.buffer = u''
+        self.position = 0
+        self.stream = None
+        self.decoder = codecs.getincrementaldecoder('utf-8-sig')()
+
+        if hasattr(source, 'read'):
+            self.stream = source
+        elif isinstance(source, unicode):
+            self.buffer = source
+        else:
+            # bytes are decoded a chunk at a time too, so that a decoding error is found while reading
+            self.stream = io.BytesIO(source)
+
+    def fill(self):
+        # reads more of the stream onto the end of the buffer, and returns False if there's nothing left
+        # at least as much as is already buffered is read, so a long token isn't rescanned once per chunk
+        if self.stream is None:
+            return False
+
+        remaining = len(self.buffer) - self.position
+        data = self.stream.read(max(self.chunk_size, remaining))
+        if isinstance(data, unicode):
+            text = data
+        else:
+            text = self.decoder.decode(data, final=not data)
+
+        if not data:
+            self.stream = None
+            if not text:
+                return False
+
+        self.buffer = self.buffer[self.position:] + text
+        self.position = 0
+        return True
+
+    def peek(self):
+        # skips any whitespace and returns the next character, or an empty string at the end
+        if self.position < len(self.buffer):
+            char = self.buffer[self.position]
+            if char not in WHITESPACE_CHARS:
+                return char
+
+        while True:
+            self.position = WHITESPACE.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError('Expected %s' % char)
+        self.position += 1
+
+    def _stringEnd(self):
+        # returns where the string that starts at the current position ends, reading more if it's not all there yet
+        while True:
+            match = STRING_END.match(self.buffer, self.position + 1)
+            if match:
+                return match.end()
+            if not self.fill():
+                raise ValueError('Unterminated string')
+
+    def readString(self):
+        try:
+            value, self.position = scanstring(self.buffer, self.position + 1)
+            return value
+        except ValueError:
+            # either the string isn't all there yet or it's actually invalid, in which case this raises again
+            self._stringEnd()
+            value, self.position = scanstring(self.buffer, self.position + 1)
+            return value
+
+    def skipString(self):
+        # checks the string is valid without decoding it
+        end = self._stringEnd()
+        match = VALID_STRING.match(self.buffer, self.position + 1, end)
+        if not match or match.end() != end:
+            raise ValueError('Invalid string')
+        self.position = end
+
+    def _scalar(self):
+        # moves past the number or literal that must come next, and returns the number match or the literal's value
+        # the longest literal is 9 characters, so that much is read first if it's not already there
+        while len(self.buffer) - self.position < 9 and self.fill():
+            pass
+
+        # a number could also go on for up to two more characters past the end of the buffer (e.g. "1e+5")
+        match = NUMBER.match(self.buffer, self.position)
+        while match and match.end() + 2 >= len(self.buffer) and self.fill():
+            match = NUMBER.match(self.buffer, self.position)
+
+        if match:
+            self.position = match.end()
+            return match
+
+        for literal, value in LITERALS:
+            if self.buffer.startswith(literal, self.position):
+                self.position += len(literal)
+                return value
+
+        raise ValueError('Expected a value')
+
+    def readScalar(self):
+        # reads a number or literal, which must come next
+        scalar = self._scalar()
+        if not hasattr(scalar, 'group'):
+            return scalar
+        if scalar.group(1) or scalar.group(2):
+            return float(scalar.group())
+        return int(scalar.group())
+
+    def _skipKey(self):
+        # WARNING: this is a private method for internal use only - do not call directly
+        if self.peek() != '"':
+            raise ValueError('Expected a key')
+        self.skipString()
+        self.expect(':')
+
+    def findKey(self, name, max_depth):
+        # moves into the object that starts at the current position and skips the members before the named one
+        # returns True when the reader is at that member's value, or False if the object ends without it
+        self.position += 1
+        if self.peek() == '}':
+            self.position += 1
+            return False
+
+        while True:
+            if self.peek() != '"':
+                raise ValueError('Expected a property name')
+            key = self.readString()
+            self.expect(':')
+            if key == name:
+                return True
+
+            self.skipValue(max_depth)
+            char = self.peek()
+            self.position += 1
+            if char == '}':
+                return False
+            if char != ',':
+                raise ValueError('Expected , or }')
+
+    def skipMembers(self, max_depth):
+        # skips the rest of the object that a member's value was just read from, including its closing brace
+        while True:
+            char = self.peek()
+            self.position += 1
+            if char == '}':
+                return
+            if char != ',':
+                raise ValueError('Expected , or }')
+            self._skipKey()
+            self.skipValue(max_depth)
+
+    def skipValue(self, max_depth):
+        # skips over the next value without building it, while still checking that every token in it is valid JSON
+        # the closing bracket of each open object or array is kept on a stack, rather than recursing
+        stack = []
+        while True:
+            char = self.peek()
+            if char == '"':
+                self.skipString()
+            elif char == '{' or char == '[':
+                if len(stack) >= max_depth:
+                    raise ValueError('Too deeply nested')
+
+                match = FLAT_CONTAINER.match(self.buffer, self.position)
+                if match:
+                    self.position = match.end()
+                else:
+                    self.position += 1
+                    closing = '}' if char == '{' else ']'
+                    if self.peek() == closing:
+                        # an empty one that didn't match because the buffer ended inside it
+                        self.position += 1
+                    else:
+                        stack.append(closing)
+                        if char == '{':
+                            self._skipKey()
+                        continue
+            elif not char:
+                raise ValueError('Unexpected end of JSON')
+            else:
+                self._scalar()
+
+            # after a value comes either the next item or the end of the innermost object or array
+            while stack:
+                char = self.peek()
+                if char == ',':
+                    self.position += 1
+                    if stack[-1] == '}':
+                        self._skipKey()
+                    break
+                if char != stack[-1]:
+                    raise ValueError('Expected , or %s' % stack[-1])
+                self.position += 1
+                stack.pop()
+            else:
+                return
+
+
+class _Walker(object):
+    # WARNING: this is a private class for internal use only - do not use directly
+    # walks the tokens from a reader against a compiled spec, validating and building the values as it goes
+
+    def __init__(self, reader, max_errors, max_depth):
+        self.reader = reader
+        self.max_errors = max_errors
+        self.max_depth = max_depth
+        self.errors = []
+        self.path = ()
+
+    def error(self, path):
+        self.errors.append(_pathName(path))
+        if self.max_errors and len(self.errors) >= self.max_errors:
+            raise _Stop()
+
+    def missing(self, spec, path):
+        kind, details = spec
+        if kind == _OBJECT:
+            return dict((name, self.missing(field, path + (name,))) for name, field in details.items())
+        if kind == _ARRAY:
+            return []
+
+        valid, value = details(None)
+        if not valid:
+            self.error(path)
+        return value
+
+    def value(self, spec, path, depth):
+        if depth > self.max_depth:
+            raise ValueError('Too deeply nested')
+
+        self.path = path
+        reader = self.reader
+        kind, details = spec
+        char = reader.peek()
+
+        if kind == _OBJECT and char == '{':
+            return self.object(details, path, depth)
+
+        if kind == _ARRAY and char == '[':
+            return self.array(details, path, depth)
+
+        if char == '{' or char == '[':
+            # the wrong kind of container, so it's skipped without being built
+            reader.skipValue(self.max_depth - depth)
+            self.error(path)
+            return None
+
+        if not char:
+            raise ValueError('Unexpected end of JSON')
+
+        if kind == _VALUE:
+            source = reader.readString() if char == '"' else reader.readScalar()
+            valid, value = details(source)
+            if not valid:
+                self.error(path)
+            return value
+
+        # null is the same as a missing object or array, and anything else is an error
+        if char == '"':
+            reader.skipString()
+            source = ''
+        else:
+            source = reader.readScalar()
+
+        if source is None:
+            return self.missing(spec, path)
+
+        self.error(path)
+        return None
+
+    def object(self, fields, path, depth):
+        reader = self.reader
+        reader.position += 1
+        values = {}
+
+        if reader.peek() == '}':
+            reader.position += 1
+        else:
+            while True:
+                if reader.peek() != '"':
+                    raise ValueError('Expected a property name')
+                name = reader.readString()
+                reader.expect(':')
+
+                field = fields.get(name)
+                if field is None:
+                    reader.skipValue(self.max_depth - depth)
+                else:
+                    values[name] = self.value(field, path + (name,), depth + 1)
+
+                char = reader.peek()
+                reader.position += 1
+                if char == '}':
+                    break
+                if char != ',':
+                    raise ValueError('Expected , or }')
+
+        for name, field in fields.items():
+            if name not in values:
+                values[name] = self.missing(field, path + (name,))
+
+        return values
+
+    def array(self, item, path, depth):
+        values = []
+        for index in self.items():
+            values.append(self.value(item, path + (index,), depth + 1))
+        return values
+
+    def items(self):
+        # yields the index of each item in the array that starts at the current position
+        # leaving the reader at the start of that item each time
+        reader = self.reader
+        reader.position += 1
+
+        if reader.peek() == ']':
+            reader.position += 1
+            return
+
+        index = 0
+        while True:
+            yield index
+            index += 1
+
+            char = reader.peek()
+            reader.position += 1
+            if char == ']':
+                return
+            if char != ',':
+                raise ValueError('Expected , or ]')
+
+
+def validateJson(source, schema, max_errors=None, max_depth=MAX_DEPTH, chunk_size=CHUNK_SIZE):
+    # source is a file object (reading bytes or text), bytes, or text
+    # returns a `(valid, values, errors)` tuple just like a Schema, where errors is a list of paths
+    # max_errors stops reading as soon as there are that many errors (e.g. 1 to fail fast),
+    # in which case values is None since it wasn't finished
+    # values is also None if the JSON is malformed
+    reader = _Reader(source, chunk_size)
+    walker = _Walker(reader, max_errors, max_depth)
+
+    try:
+        values = walker.value(_compile(schema), (), 0)
+        walker.path = ()
+        if reader.peek():
+            raise ValueError('Extra data')
+    except _Stop:
+        return False, None, walker.errors
+    except ValueError:
+        walker.errors.append(_pathName(walker.path))
+        return False, None, walker.errors
+
+    return not walker.errors, values, walker.errors
+
+
+def iterJson(source, schema, path=(), max_depth=MAX_DEPTH, chunk_size=CHUNK_SIZE):
+    # yields a `(valid, values, errors)` tuple for each item of an array in the JSON
+    # validated against the schema, with errors relative to the item
+    # path is a sequence of the property names that lead to the array, or empty if it's the whole body
+    # e.g. iterJson(body, CONTACT_SCHEMA, path=['contacts']) for `{"contacts": [{...}, {...}]}`
+    # everything else in the JSON is skipped, though it still has to be valid
+    # if there's no array at the path then nothing is yielded
+    # and if the JSON is malformed then the last item is `(False, None, [path of the error])`
+    if isinstance(path, (str, unicode)):
+        path = (path,)
+    path = tuple(path)
+
+    item = _compile(schema)
+    reader = _Reader(source, chunk_size)
+    walker = _Walker(reader, None, max_depth)
+    # the path of the current item, since the walker's path is relative to it
+    prefix = ()
+    # how many of the objects along the path are still open
+    opened = 0
+
+    try:
+        for depth, name in enumerate(path):
+            walker.path = path[:depth]
+            if reader.peek() != '{':
+                reader.skipValue(max_depth - depth)
+                break
+            if not reader.findKey(name, max_depth - depth):
+                break
+            opened += 1
+        else:
+            walker.path = path
+            if reader.peek() == '[':
+                for index in walker.items():
+                    prefix = path + (index,)
+                    walker.errors = []
+                    values = walker.value(item, (), len(path) + 1)
+                    yield not walker.errors, values, walker.errors
+                prefix = ()
+            else:
+                reader.skipValue(max_depth - len(path))
+
+        # the rest of the objects around the array are checked the same way as validateJson would
+        for depth in reversed(range(opened)):
+            walker.path = path[:depth]
+            reader.skipMembers(max_depth - depth)
+
+        walker.path = ()
+        if reader.peek():
+            raise ValueError('Extra data')
+    except ValueError:
+        yield False, None, [_pathName(prefix + walker.path)]
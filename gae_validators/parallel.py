@@ -0,0 +1,84 @@
+# validation of large imports spread across multiple processes to get around the GIL
+# the input is split into chunks which are sent to a pool of worker processes
+# each worker binds its validator and parameters once at startup, then validates whole chunks using the
+# batch version of the validator and sends back compact `(flags, values)` results
+# requires Python 3.7+ (for the executor initializer)
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import os
+
+import gae_validators
+from gae_validators import batch
+
+# set once per worker process by _initWorker
+_worker_validate = None
+
+
+def _initWorker(validator, kwargs):
+    # WARNING: this is a private method for internal use only - do not call directly
+    global _worker_validate
+
+    # callables like functools.partial don't have a name, so they always go through the generic loop
+    name = getattr(validator, '__name__', None)
+    batch_validator = getattr(batch, name, None) if name and getattr(gae_validators, name, None) is validator else None
+
+    if batch_validator:
+        # the batch versions hoist parameter checks and conversions (like choices to a set) out of the loop
+        def validate(chunk):
+            return batch_validator(chunk, **kwargs)
+    else:
+        def validate(chunk):
+            return batch._batch(validator, chunk, **kwargs)
+
+    _worker_validate = validate
+
+
+def _validateChunk(chunk):
+    # WARNING: this is a private method for internal use only - do not call directly
+    return _worker_validate(chunk)
+
+
+def _chunks(sources, chunk_size):
+    # WARNING: this is a private method for internal use only - do not call directly
+    sources = iter(sources)
+    while True:
+        chunk = list(islice(sources, chunk_size))
+        if not chunk:
+            break
+        yield chunk
+
+
+def iterParallel(validator, sources, chunk_size=10000, max_workers=None, **kwargs):
+    # yields a `(flags, values)` tuple for each chunk of sources, in input order
+    # only a few chunks per worker are in flight at a time, so sources can be a lazy iterable of any size
+    # validator must be importable by the workers, i.e. any validator from this package or a module-level function
+    max_workers = max_workers or os.cpu_count() or 1
+    max_pending = max_workers * 2
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_initWorker,
+            initargs=(validator, kwargs)) as executor:
+
+        pending = deque()
+
+        for chunk in _chunks(sources, chunk_size):
+            pending.append(executor.submit(_validateChunk, chunk))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+
+def validateParallel(validator, sources, chunk_size=10000, max_workers=None, **kwargs):
+    # returns a single `(flags, values)` tuple for all the sources in input order, just like the batch validators
+    flags = bytearray()
+    values = []
+
+    for chunk_flags, chunk_values in iterParallel(validator, sources, chunk_size=chunk_size,
+            max_workers=max_workers, **kwargs):
+        flags += chunk_flags
+        values.extend(chunk_values)
+
+    return flags, values
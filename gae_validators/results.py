@@ -0,0 +1,221 @@
+# compact containers for validation results
+# a list of `(valid, value)` tuples costs a 56 byte tuple plus an 8 byte pointer for every result
+# so when there are millions of them that's often more memory than the values themselves
+# ValidationResults packs the flags into a bitset (one bit per result), keeps the values in a list
+# or a typed array, and only stores error reasons for the results that have one
+
+from array import array
+from binascii import hexlify, unhexlify
+
+# maps every byte to 0 or 1, so that any truthy flag counts as valid
+_BOOLEAN_TABLE = bytes(bytearray([0] + [1] * 255))
+
+# the number of set bits in every possible byte
+_BIT_COUNTS = [bin(byte).count('1') for byte in range(256)]
+
+
+def _pack(flags):
+    # WARNING: this is a private method for internal use only - do not call directly
+    # packs a byte per flag into a bit per flag, with the first flag in the lowest bit of the first byte
+    # every eighth flag is gathered with a slice and converted to one big integer, which is then shifted into place
+    # so that there's no Python loop over the flags
+    flags = bytearray(flags).translate(_BOOLEAN_TABLE)
+    if not flags:
+        return bytearray()
+
+    flags += bytearray(-len(flags) % 8)
+    packed = 0
+    for bit in range(8):
+        packed |= int(hexlify(flags[bit::8]), 16) << bit
+
+    return bytearray(unhexlify('%0*x' % (len(flags) // 4, packed)))
+
+
+def _unpack(bits, length):
+    # WARNING: this is a private method for internal use only - do not call directly
+    # the reverse of _pack, which returns a bytearray with a 0 or 1 for each flag
+    if not bits:
+        return bytearray()
+
+    packed = int(hexlify(bits), 16)
+    mask = int('01' * len(bits), 16)
+    flags = bytearray(len(bits) * 8)
+    for bit in range(8):
+        flags[bit::8] = unhexlify('%0*x' % (len(bits) * 2, (packed >> bit) & mask))
+
+    del flags[length:]
+    return flags
+
+
+class Result(object):
+    # a single result with an optional error reason, which takes the same 56 bytes as a `(valid, value)` tuple
+    # because it uses slots instead of a dict
+    # it unpacks and compares just like the `(valid, value)` tuple from a validator, e.g.:
+    # valid, value = Result(*validateEmail(source))
+
+    __slots__ = ('valid', 'value', 'error')
+
+    def __init__(self, valid, value, error=None):
+        self.valid = valid
+        self.value = value
+        self.error = error
+
+    def __iter__(self):
+        yield self.valid
+        yield self.value
+
+    def __len__(self):
+        return 2
+
+    def __getitem__(self, index):
+        return (self.valid, self.value)[index]
+
+    def __eq__(self, other):
+        if isinstance(other, Result):
+            return (self.valid, self.value, self.error) == (other.valid, other.value, other.error)
+        if isinstance(other, tuple):
+            return (self.valid, self.value) == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    # it's mutable, so it can't be hashed
+    __hash__ = None
+
+    def __repr__(self):
+        if self.error is None:
+            return 'Result(%r, %r)' % (self.valid, self.value)
+        return 'Result(%r, %r, %r)' % (self.valid, self.value, self.error)
+
+
+class ValidationResults(object):
+    # flags and values are the same as what the batch validators return, so their results can be passed straight in:
+    # results = ValidationResults(*batch.validateInt(sources), typecode='q')
+    # typecode is optional, and stores the values in an array of that type (e.g. 'q' for ints or 'd' for floats)
+    # rather than a list, which saves the memory of a separate object for each value
+    # values are converted to the type of the array, and any that can't be (like None for empty sources)
+    # are kept on the side, so none are lost
+    # errors is an optional dict of the index of a result to the reason it failed
+
+    def __init__(self, flags=(), values=(), errors=None, typecode=None):
+        flags = bytearray(flags)
+        self._bits = _pack(flags)
+        self._length = len(flags)
+        self.typecode = typecode
+        self.errors = dict(errors or {})
+
+        if typecode is None:
+            self._values = list(values)
+            self._extras = None
+        else:
+            self._values = array(typecode)
+            self._extras = {}
+            for value in values:
+                self._appendValue(value)
+
+        if len(self._values) != self._length:
+            raise ValueError('There must be the same number of flags and values.')
+
+    @classmethod
+    def fromTuples(cls, results, typecode=None):
+        # builds the results from an iterable of `(valid, value)` tuples, like the ones the validators return
+        flags = bytearray()
+        values = []
+        for valid, value in results:
+            flags.append(1 if valid else 0)
+            values.append(value)
+        return cls(flags, values, typecode=typecode)
+
+    def _appendValue(self, value):
+        # WARNING: this is a private method for internal use only - do not call directly
+        if self._extras is None:
+            self._values.append(value)
+            return
+
+        try:
+            self._values.append(value)
+        except (TypeError, OverflowError):
+            # a placeholder keeps the array in line with the flags
+            self._values.append(0)
+            self._extras[len(self._values) - 1] = value
+
+    def _index(self, index):
+        # WARNING: this is a private method for internal use only - do not call directly
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('result index out of range')
+        return index
+
+    def append(self, valid, value, error=None):
+        if not self._length % 8:
+            self._bits.append(0)
+        if valid:
+            self._bits[-1] |= 1 << (self._length % 8)
+        if error is not None:
+            self.errors[self._length] = error
+        self._appendValue(value)
+        self._length += 1
+
+    def extend(self, results):
+        # adds an iterable of `(valid, value)` tuples or Results
+        for valid, value in results:
+            self.append(valid, value)
+
+    def isValid(self, index):
+        index = self._index(index)
+        return bool(self._bits[index >> 3] >> (index & 7) & 1)
+
+    def value(self, index):
+        index = self._index(index)
+        if self._extras and index in self._extras:
+            return self._extras[index]
+        return self._values[index]
+
+    def error(self, index):
+        return self.errors.get(self._index(index))
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        index = self._index(index)
+        return Result(self.isValid(index), self.value(index), self.errors.get(index))
+
+    def __iter__(self):
+        errors = self.errors
+        for index, (valid, value) in enumerate(zip(self.flags(), self.values())):
+            yield Result(valid == 1, value, errors.get(index))
+
+    def flags(self):
+        # a bytearray with a 1 for every valid result, just like the batch validators return
+        return _unpack(self._bits, self._length)
+
+    def values(self):
+        values = list(self._values)
+        if self._extras:
+            for index, value in self._extras.items():
+                values[index] = value
+        return values
+
+    def tuples(self):
+        # converts back to a list of `(valid, value)` tuples
+        return [(valid == 1, value) for valid, value in zip(self.flags(), self.values())]
+
+    def countValid(self):
+        # counts the set bits a byte at a time
+        return sum(_BIT_COUNTS[byte] for byte in self._bits)
+
+    def iterValid(self):
+        # yields the `(index, value)` of every valid result
+        for index, (valid, value) in enumerate(zip(self.flags(), self.values())):
+            if valid:
+                yield index, value
+
+    def iterInvalid(self):
+        # yields the `(index, value)` of every invalid result
+        for index, (valid, value) in enumerate(zip(self.flags(), self.values())):
+            if not valid:
+                yield index, value
@@ -1,11 +1,22 @@
+from datetime import datetime
+import io
+import os
+import subprocess
+import sys
 import unittest
 
-from gae_validators import (PY3, validateString, validateRequiredString, validateText,
+from gae_validators import batch, bulk
+from gae_validators import (ONE_MB, PY3, validateString, validateRequiredString, validateText,
     validateRequiredText, validateEmail, validateRequiredEmail, validatePhone,
-    validateRequiredPhone, validateUrl, validateRequiredUrl, validateChoices,
-    validateRequiredChoices, validateBool, validateInt, validateRequiredInt, validateFloat,
+    validateRequiredPhone, validateUrl, validateRequiredUrl, validateUrlParts, validateRequiredUrlParts,
+    validateChoices, validateRequiredChoices, validateBool, validateInt, validateRequiredInt, validateFloat,
     validateRequiredFloat, validateDateTime, validateRequiredDateTime, validateDate,
-    validateRequiredDate, validateTime, validateRequiredTime)
+    validateRequiredDate, validateTime, validateRequiredTime, ChoiceSet, Schema)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 class TestValidators(unittest.TestCase):
@@ -32,6 +43,31 @@ class TestValidators(unittest.TestCase):
         valid, value = validateString(u'\xaa')
         self.assertTrue(valid)
 
+        # long text should be checked all the way through, including anything unencodable at the very end
+        long_text = u'\xe9' * 20000
+        self.assertTrue(validateString(long_text, max_length=ONE_MB)[0])
+        if PY3:
+            self.assertFalse(validateString(long_text + '\udcc3', max_length=ONE_MB)[0])
+        for encoding in ('ascii', 'latin-1', 'utf-16', 'cp1252', 'iso-8859-15'):
+            self.assertTrue(validateString(u'test', encoding=encoding)[0], encoding)
+            self.assertEqual(validateString(long_text + u'\u0411', max_length=ONE_MB, encoding=encoding)[0],
+                encoding == 'utf-16', encoding)
+
+        # unknown encodings should still raise an error
+        self.assertRaises(LookupError, validateString, u'test', encoding='not an encoding')
+
+        # bytearray and memoryview should be decoded like bytes
+        valid, value = validateString(bytearray(u' caf\xe9 '.encode('utf-8')))
+        self.assertTrue(valid)
+        self.assertEqual(value, u'caf\xe9')
+
+        valid, value = validateString(memoryview(u' caf\xe9 '.encode('utf-8')))
+        self.assertTrue(valid)
+        self.assertEqual(value, u'caf\xe9')
+
+        valid, value = validateString(bytearray(b'\xff'))
+        self.assertFalse(valid)
+
         # whitespace should be stripped
         valid, value = validateString('  test    ')
         self.assertTrue(valid)
@@ -73,6 +109,53 @@ class TestValidators(unittest.TestCase):
         self.assertTrue(valid)
         self.assertEqual(value, 'test with inner unicode spaces')
 
+    def testValidateStringNormalize(self):
+        # composed and decomposed forms should end up the same
+        for source in (u'caf\xe9', u'cafe\u0301'):
+            self.assertEqual(validateString(source, normalize='NFC'), (True, u'caf\xe9'))
+            self.assertEqual(validateString(source, normalize='NFD'), (True, u'cafe\u0301'))
+
+        # compatibility forms should fold fullwidth letters and ligatures
+        self.assertEqual(validateString(u'\uff41dmin \ufb01le', normalize='NFKC'), (True, u'admin file'))
+
+        # decomposing can produce characters that the encoding doesn't have
+        self.assertEqual(validateString(u'caf\xe9', normalize='NFD', encoding='latin-1'), (False, ''))
+
+        # ASCII should be left alone
+        valid, value = validateString(u'  plain  text ', normalize='NFKC', fold_confusables=True)
+        self.assertEqual(value, 'plain text')
+
+        # unknown forms should raise an error, even for ASCII
+        self.assertRaises(ValueError, validateString, u'test', normalize='NFX')
+
+    def testValidateStringFoldConfusables(self):
+        # look-alike letters from other scripts should be folded and invisible characters removed
+        valid, value = validateString(u'p\u0430yp\u0430l\u200b', fold_confusables=True)
+        self.assertTrue(valid)
+        self.assertEqual(value, 'paypal')
+
+        # every look-alike of a capital I (here Greek and Cyrillic) folds to the same letter
+        self.assertEqual(validateString(u'\u0399van', fold_confusables=True), (True, 'Ivan'))
+        self.assertEqual(validateString(u'\u0406van', fold_confusables=True), (True, 'Ivan'))
+
+        # without folding they stay as they are
+        self.assertEqual(validateString(u'p\u0430ypal')[1], u'p\u0430ypal')
+
+        # spaces are still converted and condensed in the same pass, but only if asked to
+        self.assertEqual(validateString(u'\u2014 a\xa0 \u0432', fold_confusables=True), (True, u'- a \u0432'))
+        self.assertEqual(validateString(u'a\xa0b', fold_confusables=True, convert_spaces=False), (True, u'a\xa0b'))
+
+        # together with NFKC, fullwidth and look-alike letters both fold
+        self.assertEqual(validateString(u'\uff50\u0430y', normalize='NFKC', fold_confusables=True), (True, 'pay'))
+
+        # a combining mark after a folded letter is composed with it
+        self.assertEqual(validateString(u'\u0430\u0301', normalize='NFC', fold_confusables=True), (True, u'\xe1'))
+
+        # and the options are passed through by the other string validators
+        self.assertEqual(validateRequiredString(u'\u0430', fold_confusables=True), (True, 'a'))
+        self.assertEqual(validateText(u'\u0430\n\u0435', fold_confusables=True), (True, 'a\ne'))
+        self.assertEqual(validateRequiredText(u'\u200b', fold_confusables=True), (False, ''))
+
     def testValidateRequiredString(self):
         # empty string should fail
         valid, value = validateRequiredString('')
@@ -145,6 +228,58 @@ class TestValidators(unittest.TestCase):
         # confirm it hasn't been modified
         self.assertEqual(value, 'test@example.com')
 
+        # labels that are too long or start with a hyphen should fail
+        valid, value = validateEmail('test@' + 'a' * 64 + '.com')
+        self.assertFalse(valid)
+
+        valid, value = validateEmail('test@-example.com')
+        self.assertFalse(valid)
+
+        # empty labels and TLDs with numbers should fail
+        valid, value = validateEmail('test@example..com')
+        self.assertFalse(valid)
+
+        valid, value = validateEmail('test@example.c0m')
+        self.assertFalse(valid)
+
+        # long domains that fail at the end should fail
+        valid, value = validateEmail('test@' + ('a' * 62 + '.') * 7 + '1')
+        self.assertFalse(valid)
+
+        # internationalized domains should pass, whether they're encoded or not
+        valid, value = validateEmail(u'test@\u043f\u0440\u0438\u043c\u0435\u0440.\u0440\u0444')
+        self.assertTrue(valid)
+        self.assertEqual(value, u'test@\u043f\u0440\u0438\u043c\u0435\u0440.\u0440\u0444')
+
+        valid, value = validateEmail('test@xn--e1afmkfd.xn--p1ai')
+        self.assertTrue(valid)
+
+        # but punycode TLDs still have to be valid labels that decode
+        for tld in ('xn--', 'xn--abc-', 'xn--' + 'a' * 200, 'xn--zzzzzzzzz'):
+            valid, value = validateEmail('test@example.' + tld)
+            self.assertFalse(valid, tld)
+
+        # and internationalized labels follow the same rules as ASCII ones
+        for email in (u'user@-\u00e9.com', u'user@a.\u00e9', u'user@a.\u00e99', u'user@ex.\u0430\u043c1',
+                'user@xn----bga.com', 'user@a.xn--9-9fa'):
+            valid, value = validateEmail(email)
+            self.assertFalse(valid, email)
+
+        # blocked domains should fail, along with their subdomains
+        blocked_domains = set(['example.com', 'xn--e1afmkfd.xn--p1ai'])
+        valid, value = validateEmail('test@example.com', blocked_domains=blocked_domains)
+        self.assertFalse(valid)
+
+        valid, value = validateEmail('test@Mail.EXAMPLE.com', blocked_domains=blocked_domains)
+        self.assertFalse(valid)
+
+        valid, value = validateEmail(u'test@\u043f\u0440\u0438\u043c\u0435\u0440.\u0440\u0444',
+            blocked_domains=blocked_domains)
+        self.assertFalse(valid)
+
+        valid, value = validateEmail('test@notexample.com', blocked_domains=blocked_domains)
+        self.assertTrue(valid)
+
     def testValidateRequiredEmail(self):
         # empty string should fail
         valid, value = validateRequiredEmail('')
@@ -203,6 +338,45 @@ class TestValidators(unittest.TestCase):
         self.assertTrue(valid)
         self.assertEqual(value, '+15555555555;ext=123456789')
 
+        # the last separator should be used when there are several
+        valid, value = validatePhone('+1 555 555 5555 ext. 12', extension_separators=['ext', 'x'])
+        self.assertTrue(valid)
+        self.assertEqual(value, '+15555555555;ext=12')
+
+        # international numbers should be validated by their country code
+        valid, value = validatePhone('+44 20 7946 0958')
+        self.assertTrue(valid)
+        self.assertEqual(value, '+442079460958')
+
+        valid, value = validatePhone('+33 1 23 45 67 89')
+        self.assertTrue(valid)
+        self.assertEqual(value, '+33123456789')
+
+        # including when they use an international call prefix instead of a plus sign
+        valid, value = validatePhone('0044 20 7946 0958')
+        self.assertTrue(valid)
+        self.assertEqual(value, '+442079460958')
+
+        valid, value = validatePhone('011 44 20 7946 0958')
+        self.assertTrue(valid)
+        self.assertEqual(value, '+442079460958')
+
+        # too short for the country should fail
+        valid, value = validatePhone('+1 555 555 555')
+        self.assertFalse(valid)
+
+        valid, value = validatePhone('+44 20 7946')
+        self.assertFalse(valid)
+
+        # unassigned country codes should fail
+        valid, value = validatePhone('+999 123 4567')
+        self.assertFalse(valid)
+
+        # other unicode digits should be converted to ASCII
+        valid, value = validatePhone(u'\uff15\uff15\uff15-\uff15\uff15\uff15-\uff15\uff15\uff15\uff15')
+        self.assertTrue(valid)
+        self.assertEqual(value, '+15555555555')
+
     def testValidateRequiredPhone(self):
         # empty string should fail
         valid, value = validateRequiredPhone('')
@@ -238,6 +412,85 @@ class TestValidators(unittest.TestCase):
         valid, value = validateUrl('http://example.com/path?key=value')
         self.assertTrue(valid)
 
+        # ports, localhost, and IP addresses should pass
+        for url in ('http://example.com:8080/', 'http://localhost:8000', 'http://127.0.0.1/', 'http://[::1]:8080/'):
+            valid, value = validateUrl(url)
+            self.assertTrue(valid, url)
+
+        # bad hosts, ports, and paths should fail
+        for url in ('ftp://example.com', 'http://-example.com', 'http://example', 'http://example.com:80a',
+                'http://1.2.3.4.', 'http://example.com/a path', 'http://example.com?'):
+            valid, value = validateUrl(url)
+            self.assertFalse(valid, url)
+
+        # long invalid hosts should fail quickly instead of backtracking
+        valid, value = validateUrl('http://' + 'a:' * 240 + '!')
+        self.assertFalse(valid)
+
+        # normalize should lowercase the scheme and host and drop the default port
+        valid, value = validateUrl('HTTPS://Example.COM:443/Path', normalize=True)
+        self.assertTrue(valid)
+        self.assertEqual(value, 'https://example.com/Path')
+
+        # and should encode internationalized hosts
+        valid, value = validateUrl(u'http://b\xfccher.de/', normalize=True)
+        self.assertTrue(valid)
+        self.assertEqual(value, 'http://xn--bcher-kva.de/')
+
+        # but they're valid either way, since normalize only changes the value
+        valid, value = validateUrl(u'http://b\xfccher.de:8080/')
+        self.assertTrue(valid)
+        self.assertEqual(value, u'http://b\xfccher.de:8080/')
+
+        valid, value = validateUrlParts(u'http://b\xfccher.de:8080/')
+        self.assertEqual(value.host, u'b\xfccher.de')
+        self.assertEqual(value.port, 8080)
+
+        valid, value = validateUrl(u'http://-\xfc.de/')
+        self.assertFalse(valid)
+
+    def testValidateUrlParts(self):
+        # empty string should pass with no parts
+        valid, value = validateUrlParts('')
+        self.assertTrue(valid)
+        self.assertEqual(value, None)
+
+        # invalid should fail with no parts
+        valid, value = validateUrlParts('http://')
+        self.assertFalse(valid)
+        self.assertEqual(value, None)
+
+        # each part should be split out
+        valid, value = validateUrlParts('http://example.com:8080/path?key=value#top')
+        self.assertTrue(valid)
+        self.assertEqual(value, ('http', 'example.com', 8080, '/path', 'key=value', 'top'))
+        self.assertEqual(value.host, 'example.com')
+        self.assertEqual(value.port, 8080)
+        self.assertEqual(value.geturl(), 'http://example.com:8080/path?key=value#top')
+
+        # missing parts should be empty or None
+        valid, value = validateUrlParts('example.com')
+        self.assertTrue(valid)
+        self.assertEqual(value, ('http', 'example.com', None, '', None, None))
+
+        # the host should be the whole IPv6 address without a port
+        valid, value = validateUrlParts('http://[::1]:8080')
+        self.assertEqual(value.host, '[::1]')
+        self.assertEqual(value.port, 8080)
+
+        valid, value = validateUrlParts('http://Example.com:80', normalize=True)
+        self.assertEqual(value, ('http', 'example.com', None, '', None, None))
+
+    def testValidateRequiredUrlParts(self):
+        # empty string should fail
+        valid, value = validateRequiredUrlParts('')
+        self.assertFalse(valid)
+
+        # string with something should pass
+        valid, value = validateRequiredUrlParts('http://example.com')
+        self.assertTrue(valid)
+        self.assertEqual(value.host, 'example.com')
+
     def testValidateRequiredUrl(self):
         # empty string should fail
         valid, value = validateRequiredUrl('')
@@ -260,6 +513,34 @@ class TestValidators(unittest.TestCase):
         valid, value = validateChoices('test', ['test'])
         self.assertTrue(valid)
 
+    def testChoiceSet(self):
+        choices = ChoiceSet(['United States', 'Canada'])
+        self.assertEqual(len(choices), 2)
+        self.assertTrue('Canada' in choices)
+        self.assertFalse('canada' in choices)
+
+        valid, value = validateChoices(' Canada ', choices)
+        self.assertTrue(valid)
+        self.assertEqual(value, 'Canada')
+
+        valid, value = validateChoices('Mexico', choices)
+        self.assertFalse(valid)
+
+        # looser matching should return the original option
+        choices = ChoiceSet([u'United  States', 'Canada'], ignore_case=True, normalize=True)
+        valid, value = validateChoices(u'united\xa0states', choices)
+        self.assertTrue(valid)
+        self.assertEqual(value, u'United  States')
+        self.assertEqual(choices.get('CANADA'), 'Canada')
+
+        valid, value = validateRequiredChoices('', choices)
+        self.assertFalse(valid)
+
+        # options can be loaded from a file with one per line
+        choices = ChoiceSet.fromFile(io.StringIO(u'United States\r\n\nCanada\n'), ignore_case=True)
+        self.assertEqual(sorted(choices), ['Canada', 'United States'])
+        self.assertEqual(validateChoices('canada', choices), (True, 'Canada'))
+
     def testValidateRequiredChoices(self):
         # should fail if there's nothing
         valid, value = validateRequiredChoices('', [])
@@ -376,6 +657,39 @@ class TestValidators(unittest.TestCase):
         valid, value = validateDateTime('1970-01-20T13:45', future_only=True)
         self.assertFalse(valid)
 
+        # the comparison should use the given time instead of the current one
+        now = datetime(2000, 1, 1)
+        valid, value = validateDateTime('1999-12-31T23:59', future_only=True, now=now)
+        self.assertFalse(valid)
+        valid, value = validateDateTime('2000-01-01T00:01', future_only=True, now=now)
+        self.assertTrue(valid)
+
+        # formats that strptime allows but aren't fixed width should still pass
+        valid, value = validateDateTime('2020-1-2T3:04')
+        self.assertTrue(valid)
+        self.assertEqual(value, datetime(2020, 1, 2, 3, 4))
+
+        valid, value = validateDateTime('2020131', date_format='%Y%m%d')
+        self.assertTrue(valid)
+        self.assertEqual(value, datetime(2020, 1, 31))
+
+        # fractions of a second should be padded like strptime does
+        valid, value = validateDateTime('2020-01-02T03:04:05.12Z', date_format='%Y-%m-%dT%H:%M:%S.%fZ')
+        self.assertTrue(valid)
+        self.assertEqual(value, datetime(2020, 1, 2, 3, 4, 5, 120000))
+
+        # and dates that don't exist should fail
+        valid, value = validateDateTime('2021-02-29T03:04')
+        self.assertFalse(valid)
+
+        valid, value = validateDateTime('2020-01-02T24:00')
+        self.assertFalse(valid)
+
+        # custom formats that can't use the fast path should still work
+        valid, value = validateDateTime('Jan 2 2020', date_format='%b %d %Y')
+        self.assertTrue(valid)
+        self.assertEqual(value, datetime(2020, 1, 2))
+
     def testValidateRequiredDateTime(self):
         # empty should fail
         valid, value = validateRequiredDateTime('')
@@ -437,6 +751,813 @@ class TestValidators(unittest.TestCase):
         valid, value = validateRequiredTime('')
         self.assertFalse(valid)
 
+    def testSchema(self):
+        schema = Schema({
+            'email': validateRequiredEmail,
+            'age': (validateInt, {'min_amount': 13}),
+            'bio': validateText
+        })
+
+        # every field should be validated in one call
+        valid, values, errors = schema({'email': ' test@example.com ', 'age': '30', 'bio': 'foo\nbar'})
+        self.assertTrue(valid)
+        self.assertEqual(values, {'email': 'test@example.com', 'age': 30, 'bio': 'foo\nbar'})
+        self.assertEqual(errors, [])
+
+        # bound parameters should be applied and every failing field reported
+        valid, values, errors = schema.validate({'email': 'example.com', 'age': '12'})
+        self.assertFalse(valid)
+        self.assertEqual(sorted(errors), ['age', 'email'])
+        self.assertEqual(values['age'], 12)
+
+        # missing fields are treated as None just like a missing request parameter
+        valid, values, errors = schema({})
+        self.assertEqual(errors, ['email'])
+        self.assertEqual(values['bio'], '')
+        self.assertEqual(values['age'], None)
+
+    def testLazyRecord(self):
+        calls = []
+
+        def validateCounted(source):
+            calls.append(source)
+            return validateInt(source)
+
+        schema = Schema([('email', validateRequiredEmail), ('age', validateCounted), ('bio', validateText)])
+        record = schema.lazy({'email': 'example.com', 'age': '30'})
+
+        # nothing should be validated until it's read, and then only once
+        self.assertEqual(calls, [])
+        self.assertEqual(record['age'], 30)
+        self.assertEqual(record['age'], 30)
+        self.assertEqual(record.result('age'), (True, 30))
+        self.assertEqual(calls, ['30'])
+        self.assertTrue(record.isValid('age'))
+
+        # single fields can be checked
+        self.assertFalse(record.isValid('email'))
+        self.assertEqual(record['email'], 'example.com')
+
+        # the whole picture should match validating everything up front
+        self.assertFalse(record.isValid())
+        self.assertEqual(record.errors, ['email'])
+        self.assertEqual(record.values, {'email': 'example.com', 'age': 30, 'bio': ''})
+        self.assertEqual(calls, ['30'])
+
+        self.assertTrue('bio' in record)
+        self.assertFalse('other' in record)
+        self.assertRaises(KeyError, lambda: record['other'])
+
+        # no source acts like an empty one
+        record = schema.lazy(None)
+        self.assertEqual(record.errors, ['email'])
+
+
+@unittest.skipUnless(sys.version_info >= (3, 7), 'requires Python 3.7+ for -X importtime')
+class TestImport(unittest.TestCase):
+
+    # generous enough for a slow machine, while the regexes and re module alone used to take about as long
+    BUDGET_MICROSECONDS = 20000
+
+    def testImportTime(self):
+        import shutil
+        import tempfile
+
+        # compiling the source isn't part of the budget, so the bytecode is written to a temporary cache first
+        # even where writing it is turned off (which is common in containers)
+        cache = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache)
+        env = dict(os.environ, PYTHONPYCACHEPREFIX=cache)
+        env.pop('PYTHONDONTWRITEBYTECODE', None)
+        cwd = os.path.dirname(os.path.abspath(__file__))
+        subprocess.check_call([sys.executable, '-S', '-c', 'import gae_validators'], cwd=cwd, env=env)
+
+        # then a new process measures a cold import, without site so that nothing else is imported first
+        output = subprocess.check_output([sys.executable, '-S', '-X', 'importtime', '-c', 'import gae_validators'],
+            stderr=subprocess.STDOUT, cwd=cwd, env=env)
+
+        for line in output.decode('utf-8').splitlines():
+            parts = [part.strip() for part in line.split('|')]
+            if parts[-1] == 'gae_validators':
+                self.assertLess(int(parts[1]), self.BUDGET_MICROSECONDS)
+                break
+        else:
+            self.fail('gae_validators not found in import times')
+
+    def testLazyImports(self):
+        # the regexes shouldn't be compiled, or re even imported, until they're needed
+        code = ('import sys, gae_validators; '
+            'print(sys.modules.get("re") is None, "search" not in vars(gae_validators.EMAIL_USER)); '
+            'gae_validators.validateEmail("test@example.com"); '
+            'print("search" in vars(gae_validators.EMAIL_USER))')
+        output = subprocess.check_output([sys.executable, '-S', '-c', code],
+            cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(output.decode('utf-8').split(), ['True', 'True', 'True'])
+
+
+class TestBatch(unittest.TestCase):
+
+    STRINGS = ['', None, '  test    ', 'a' * 501, 'foo\r\nbar', u'test\xa0with\u2000spaces', b'\xff', 'foo']
+    EMAILS = ['', 'example.com', 't(es>t@example.com', 'test@example', ' test@example.com ']
+    PHONES = ['', 'not a phone', '12345678901234567890', '555-555-5555', '(555) 555-5555 ext 123']
+    URLS = ['', 'http://', 'example.com', 'http://example.com/path?key=value']
+    NUMBERS = ['', None, 'None', '08', '3.14159', str(-2**64), str(2**64), '0', '-5']
+    DATES = ['', None, 'None', '3000-01-20T13:45', '1970-01-20T13:45', '3000-01-20', '1970-01-20', '13:45']
+
+    def assertMatchesScalar(self, validator, batch_validator, sources, **kwargs):
+        flags, values = batch_validator(sources, **kwargs)
+        self.assertIsInstance(flags, bytearray)
+        self.assertEqual(len(flags), len(sources))
+        for source, flag, value in zip(sources, flags, values):
+            self.assertEqual((bool(flag), value), validator(source, **kwargs))
+
+    def testBatch(self):
+        self.assertMatchesScalar(validateString, batch.validateString, self.STRINGS)
+        self.assertMatchesScalar(validateString, batch.validateString, self.STRINGS, max_length=3, condense=False)
+        self.assertMatchesScalar(validateString, batch.validateString, self.STRINGS + [u'p\u0430y'], normalize='NFKC',
+            fold_confusables=True)
+        self.assertMatchesScalar(validateRequiredString, batch.validateRequiredString, self.STRINGS, min_length=4)
+        self.assertMatchesScalar(validateText, batch.validateText, self.STRINGS)
+        self.assertMatchesScalar(validateRequiredText, batch.validateRequiredText, self.STRINGS)
+        self.assertMatchesScalar(validateEmail, batch.validateEmail, self.EMAILS)
+        self.assertMatchesScalar(validateRequiredEmail, batch.validateRequiredEmail, self.EMAILS)
+        self.assertMatchesScalar(validatePhone, batch.validatePhone, self.PHONES)
+        self.assertMatchesScalar(validatePhone, batch.validatePhone, self.PHONES, extension_separators=['ext'])
+        self.assertMatchesScalar(validateRequiredPhone, batch.validateRequiredPhone, self.PHONES)
+        self.assertMatchesScalar(validateUrl, batch.validateUrl, self.URLS)
+        self.assertMatchesScalar(validateRequiredUrl, batch.validateRequiredUrl, self.URLS)
+        self.assertMatchesScalar(validateUrl, batch.validateUrl, self.URLS, normalize=True)
+        self.assertMatchesScalar(validateUrlParts, batch.validateUrlParts, self.URLS)
+        self.assertMatchesScalar(validateRequiredUrlParts, batch.validateRequiredUrlParts, self.URLS)
+        self.assertMatchesScalar(validateChoices, batch.validateChoices, self.STRINGS, choices=['foo', 'test'])
+        self.assertMatchesScalar(validateRequiredChoices, batch.validateRequiredChoices, self.STRINGS,
+            choices=['foo', 'test'])
+        self.assertMatchesScalar(validateChoices, batch.validateChoices, self.STRINGS,
+            choices=ChoiceSet(['FOO'], ignore_case=True))
+        # a string of choices matches substrings, just like the scalar version
+        self.assertMatchesScalar(validateChoices, batch.validateChoices, self.STRINGS + ['oo'], choices='foo')
+        self.assertMatchesScalar(validateRequiredChoices, batch.validateRequiredChoices, ['fo', 'x', ''],
+            choices='foo')
+        self.assertMatchesScalar(validateBool, batch.validateBool, self.STRINGS)
+        self.assertMatchesScalar(validateInt, batch.validateInt, self.NUMBERS)
+        self.assertMatchesScalar(validateInt, batch.validateInt, self.NUMBERS, min_amount=0, max_amount=10)
+        self.assertMatchesScalar(validateRequiredInt, batch.validateRequiredInt, self.NUMBERS)
+        self.assertMatchesScalar(validateFloat, batch.validateFloat, self.NUMBERS)
+        self.assertMatchesScalar(validateRequiredFloat, batch.validateRequiredFloat, self.NUMBERS)
+        self.assertMatchesScalar(validateDateTime, batch.validateDateTime, self.DATES)
+        self.assertMatchesScalar(validateDateTime, batch.validateDateTime, self.DATES, future_only=True)
+        self.assertMatchesScalar(validateRequiredDateTime, batch.validateRequiredDateTime, self.DATES,
+            past_only=True)
+        self.assertMatchesScalar(validateDate, batch.validateDate, self.DATES)
+        self.assertMatchesScalar(validateDate, batch.validateDate, self.DATES, future_only=True,
+            now=datetime(2000, 1, 1))
+        self.assertMatchesScalar(validateRequiredDate, batch.validateRequiredDate, self.DATES, past_only=True)
+        self.assertMatchesScalar(validateTime, batch.validateTime, self.DATES)
+        self.assertMatchesScalar(validateRequiredTime, batch.validateRequiredTime, self.DATES)
+
+        # any iterable should work, including generators
+        flags, values = batch.validateInt(str(i) for i in range(3))
+        self.assertEqual(list(flags), [1, 1, 1])
+        self.assertEqual(values, [0, 1, 2])
+
+
+class TestResults(unittest.TestCase):
+
+    def testValidationResults(self):
+        from gae_validators.results import Result, ValidationResults
+
+        sources = [str(i) for i in range(-10, 10)] + ['', 'x', str(2 ** 70)]
+        flags, values = batch.validateInt(sources, min_amount=0)
+        expected = [validateInt(source, min_amount=0) for source in sources]
+
+        # typed arrays keep values that don't fit on the side
+        for typecode in (None, 'q' if PY3 else 'l'):
+            results = ValidationResults(flags, values, typecode=typecode)
+            self.assertEqual(len(results), len(sources))
+            self.assertEqual(results.tuples(), expected)
+            self.assertEqual(list(results), expected)
+            self.assertEqual(results.flags(), flags)
+            self.assertEqual(results.values(), values)
+            self.assertEqual(results.countValid(), sum(flags))
+            self.assertEqual(results[-1], expected[-1])
+            self.assertEqual(results.value(20), None)
+            self.assertTrue(results.isValid(10))
+            self.assertFalse(results.isValid(9))
+            self.assertRaises(IndexError, results.isValid, len(sources))
+
+            self.assertEqual(list(results.iterValid()), [(i, v) for i, (f, v) in enumerate(expected) if f])
+            self.assertEqual(list(results.iterInvalid()), [(i, v) for i, (f, v) in enumerate(expected) if not f])
+
+        # results can be added one at a time with an error
+        results = ValidationResults.fromTuples(expected[:9])
+        results.append(False, None, error='not a number')
+        results.extend([(True, 1)])
+        self.assertEqual(results.tuples(), expected[:9] + [(False, None), (True, 1)])
+        self.assertEqual(results.error(9), 'not a number')
+        self.assertEqual(results.error(8), None)
+        self.assertEqual(results[9], Result(False, None, 'not a number'))
+        self.assertEqual(results.countValid(), 1)
+
+        self.assertRaises(ValueError, ValidationResults, flags, values[1:])
+
+    def testResult(self):
+        from gae_validators.results import Result
+
+        result = Result(*validateEmail('foo@example.com'))
+        valid, value = result
+        self.assertTrue(valid)
+        self.assertEqual(value, 'foo@example.com')
+        self.assertEqual(result, (True, 'foo@example.com'))
+        self.assertEqual(result[1], 'foo@example.com')
+        self.assertNotEqual(result, Result(True, 'foo@example.com', 'error'))
+        self.assertRaises(AttributeError, setattr, result, 'other', 1)
+
+
+class TestDomains(unittest.TestCase):
+
+    def testDomainIndex(self):
+        import shutil
+        import tempfile
+        from gae_validators.domains import DomainIndex, buildIndexFromFile, main
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'blocked.idx')
+
+        source = io.StringIO(u'# disposable\nExample.com\n\n*.mailinator.com\n.spam.net\n'
+            u'\u043f\u0440\u0438\u043c\u0435\u0440.\u0440\u0444\nexample.com\n')
+        self.assertEqual(buildIndexFromFile(source, path), 4)
+
+        index = DomainIndex(path)
+        self.addCleanup(index.close)
+        self.assertEqual(len(index), 4)
+        self.assertEqual(list(index), ['example.com', 'mailinator.com', 'spam.net', 'xn--e1afmkfd.xn--p1ai'])
+        self.assertTrue('example.com' in index)
+        self.assertTrue('EXAMPLE.COM' in index)
+        self.assertFalse('mail.example.com' in index)
+        self.assertFalse('example.org' in index)
+
+        # validateEmail also checks parent domains
+        for email, expected in (('a@example.com', False), ('a@sub.mailinator.com', False), ('a@spam.net', False),
+                (u'a@\u043f\u0440\u0438\u043c\u0435\u0440.\u0440\u0444', False), ('a@example.org', True),
+                ('a@notspam.net', True), ('', True)):
+            valid, value = validateEmail(email, blocked_domains=index)
+            self.assertEqual(valid, expected, email)
+
+        valid, value = validateRequiredEmail('', blocked_domains=index)
+        self.assertFalse(valid)
+
+        self.assertEqual(batch.validateEmail(['a@example.com', 'a@example.org'], blocked_domains=index),
+            (bytearray([0, 1]), ['a@example.com', 'a@example.org']))
+
+        # the command line tool builds the same index from a file
+        text_path = os.path.join(directory, 'blocked.txt')
+        with io.open(text_path, 'w', encoding='utf-8') as f:
+            f.write(u'a.com\nb.com\n' + u''.join(u'%d.example\n' % i for i in range(1000)))
+        # the count is reported on stderr, which is captured to keep the test output clean
+        stderr = sys.stderr
+        sys.stderr = PY3 and io.StringIO() or io.BytesIO()
+        try:
+            self.assertEqual(main([text_path, path]), 0)
+            message = sys.stderr.getvalue()
+        finally:
+            sys.stderr = stderr
+        self.assertEqual(message, '1002 domains written to %s\n' % path)
+
+        with DomainIndex(path) as rebuilt:
+            self.assertEqual(len(rebuilt), 1002)
+            self.assertTrue(all(domain in rebuilt for domain in ['a.com', 'b.com', '0.example', '999.example']))
+            self.assertFalse('1000.example' in rebuilt)
+
+        self.assertRaises(ValueError, DomainIndex, text_path)
+
+
+class TestJsonStream(unittest.TestCase):
+
+    def testValidateJson(self):
+        from gae_validators.jsonstream import CHUNK_SIZE, validateJson
+
+        schema = Schema({
+            'name': validateRequiredString,
+            'age': (validateInt, {'min_amount': 13}),
+            'address': {'city': validateString, 'zip': validateRequiredString},
+            'contacts': [{'email': validateEmail, 'tags': [validateString]}]
+        })
+
+        body = (b'{"name": "Jane", "age": 30, "ignored": {"deeply": [{"nested": "]}"}]}, '
+            b'"address": {"city": "Springfield", "zip": "12345"}, '
+            b'"contacts": [{"email": "a@example.com", "tags": ["x", "y"]}, {"email": "b@example.com", "extra": 1}]}')
+        expected = {'name': 'Jane', 'age': 30, 'address': {'city': 'Springfield', 'zip': '12345'},
+            'contacts': [{'email': 'a@example.com', 'tags': ['x', 'y']}, {'email': 'b@example.com', 'tags': []}]}
+
+        # bytes, text, and file objects read a few bytes at a time should all be the same
+        for source in (body, body.decode('utf-8'), io.BytesIO(body)):
+            self.assertEqual(validateJson(source, schema, chunk_size=3), (True, expected, []))
+
+        # missing fields are validated as None, and errors are paths
+        body = b'{"age": 5, "address": null, "contacts": [{"email": "bad"}, {"email": ["not", "a", "string"]}]}'
+        valid, values, errors = validateJson(body, schema)
+        self.assertFalse(valid)
+        self.assertEqual(sorted(errors), ['address.zip', 'age', 'contacts.0.email', 'contacts.1.email', 'name'])
+        self.assertEqual(values['address'], {'city': '', 'zip': ''})
+        self.assertEqual(values['contacts'][1]['email'], None)
+
+        # max_errors stops reading at that many errors
+        self.assertEqual(validateJson(body, schema, max_errors=1), (False, None, ['age']))
+
+        # malformed JSON stops at the last path that was read
+        self.assertEqual(validateJson(b'{"name": "Jane", "age": 30', schema), (False, None, ['age']))
+        self.assertEqual(validateJson(b'"Jane" extra', validateString), (False, None, ['']))
+        self.assertEqual(validateJson(b'[' * 100 + b']' * 100, schema), (False, None, ['']))
+        self.assertEqual(validateJson(b'{"name": "\xff"}', schema), (False, None, ['']))
+
+        # values that aren't in the schema are skipped without being built, but they still have to be valid
+        for junk in (b'[1 2 ! @]', b'{"a" 1}', b'[1,]', b'"\\q"', b'01', b'{"a": [}', b'tru'):
+            body = b'{"name": "Jane", "junk": ' + junk + b'}'
+            for chunk_size in (1, CHUNK_SIZE):
+                self.assertEqual(validateJson(body, schema, chunk_size=chunk_size)[:2], (False, None), junk)
+
+        body = b'{"name": "Jane", "junk": {"a": [1, {"b": null}, "s\\u00e9", -1.5e3, true, []], "c": {}}}'
+        self.assertEqual(validateJson(body, {'name': validateRequiredString}, chunk_size=1),
+            (True, {'name': 'Jane'}, []))
+
+    def testIterJson(self):
+        from gae_validators.jsonstream import iterJson
+
+        body = io.BytesIO(b'{"total": 3, "contacts": [{"email": "a@example.com"}, {"email": "bad"}, {}], "more": 1}')
+        results = list(iterJson(body, {'email': validateRequiredEmail}, path=['contacts'], chunk_size=2))
+        self.assertEqual(results, [(True, {'email': 'a@example.com'}, []), (False, {'email': 'bad'}, ['email']),
+            (False, {'email': ''}, ['email'])])
+
+        # a top level array doesn't need a path
+        results = list(iterJson(u'[1, "x", 200]', (validateInt, {'max_amount': 100})))
+        self.assertEqual(results, [(True, 1, []), (False, None, ['']), (False, 200, [''])])
+
+        # nothing is yielded without an array at the path
+        self.assertEqual(list(iterJson(b'{"contacts": {}}', {}, path='contacts')), [])
+        self.assertEqual(list(iterJson(b'{"other": []}', {}, path='contacts')), [])
+
+        # malformed JSON ends with an error
+        results = list(iterJson(b'[{"email": "a@example.com"}, {"email": ', {'email': validateEmail}))
+        self.assertEqual(results, [(True, {'email': 'a@example.com'}, []), (False, None, ['1.email'])])
+
+        # including anything before or after the array, or around a missing one, at any chunk size
+        schema = {'email': validateEmail}
+        item = (True, {'email': 'a@b.com'}, [])
+        for body, expected in ((b'{"x": 1 "contacts": [{"email": "a@b.com"}]}', [(False, None, [''])]),
+                (b'{"contacts": [{"email": "a@b.com"}]} garbage', [item, (False, None, [''])]),
+                (b'{"contacts": [{"email": "a@b.com"}], "x": [1 2]}', [item, (False, None, [''])]),
+                (b'{"contacts": [{"email": "a@b.com"}]', [item, (False, None, [''])]),
+                (b'{"a": {"contacts": [{"email": "a@b.com"}], "x": tru}}', [item, (False, None, ['a'])]),
+                (b'{"other": [1 2]}', [(False, None, [''])]),
+                (b'{"contacts": {"x": }}', [(False, None, ['contacts'])]),
+                (b'{"contacts": [{"email": "a@b.com"}], "x": [1, {"y": null}]}', [item])):
+            for chunk_size in (1, 1024):
+                path = b'"a"' in body and ['a', 'contacts'] or ['contacts']
+                self.assertEqual(list(iterJson(body, schema, path=path, chunk_size=chunk_size)), expected, body)
+
+
+class TestForms(unittest.TestCase):
+
+    def setUp(self):
+        self.schema = Schema({
+            'email': validateRequiredEmail,
+            'age': (validateInt, {'min_amount': 13}),
+            'bio': (validateText, {'max_length': 10})
+        })
+
+    def testUrlencoded(self):
+        from gae_validators.forms import validateForm
+
+        body = b'email=jane%40example.com&ignored=' + b'x' * 1000 + b'&age=30&bio=%E2%9C%93++ok&name'
+        expected = {'email': 'jane@example.com', 'age': 30, 'bio': u'\u2713 ok'}
+
+        # bytes and file objects read a few bytes at a time should be the same, including split percent escapes
+        for source in (body, io.BytesIO(body)):
+            self.assertEqual(validateForm(source, self.schema, chunk_size=3), (True, expected, []))
+
+        # missing fields are validated as None, and the last of a repeated field is used
+        valid, values, errors = validateForm(b'age=5&age=40&bio=', self.schema)
+        self.assertFalse(valid)
+        self.assertEqual(values, {'email': '', 'age': 40, 'bio': ''})
+        self.assertEqual(errors, ['email'])
+
+        # whitespace doesn't count towards rejecting a field early, since it could be condensed
+        valid, values, errors = validateForm(b'email=a%40b.com&bio=' + b'+' * 100 + b'a+++b', self.schema)
+        self.assertEqual(values['bio'], 'a b')
+
+        # but too many other characters are rejected without reading them all, as are undecodable ones
+        for bio in (b'y' * 100000, b'%FF'):
+            valid, values, errors = validateForm(b'email=a%40b.com&bio=' + bio, self.schema)
+            self.assertEqual(errors, ['bio'])
+            self.assertEqual(values['bio'], None)
+
+        # the limit comes from the validator's own max_length when it isn't bound
+        from gae_validators.forms import _maxLength
+        self.assertEqual(_maxLength(validateEmail, ONE_MB), 500)
+        self.assertEqual(_maxLength(validateText, 1), ONE_MB)
+        self.assertEqual(_maxLength(validateInt, 100), 100)
+
+        # normalizing and folding can shorten the text by more than its whitespace, so there's no early limit
+        from functools import partial
+        schema = Schema({
+            'folded': partial(validateString, max_length=10, fold_confusables=True),
+            'composed': partial(validateString, max_length=10, normalize='NFC')
+        })
+        body = b'folded=' + b'a%E2%80%8B' * 8 + b'&composed=' + b'e%CC%81' * 8
+        valid, values, errors = validateForm(body, schema)
+        self.assertTrue(valid)
+        self.assertEqual(values, {'folded': 'aaaaaaaa', 'composed': u'\xe9' * 8})
+
+    def testMultipart(self):
+        from gae_validators.forms import validateForm
+
+        content_type = 'multipart/form-data; boundary="xYz"; charset=utf-8'
+        body = (b'preamble\r\n--xYz\r\nContent-Disposition: form-data; name="email"\r\n\r\njane@example.com\r\n'
+            b'--xYz\r\nContent-Disposition: form-data; name="upload"; filename="a.txt"\r\n'
+            b'Content-Type: text/plain\r\n\r\n' + b'--xY' * 1000 + b'\r\n'
+            b'--xYz\r\nContent-Disposition: form-data; name="bio"\r\n\r\nline1\r\nok\r\n--xYz--\r\n')
+        expected = {'email': 'jane@example.com', 'age': None, 'bio': 'line1\r\nok'}
+
+        for chunk_size in (1, 7, 1000):
+            self.assertEqual(validateForm(body, self.schema, content_type, chunk_size=chunk_size),
+                (True, expected, []))
+
+        # a body that ends early is malformed, with an error for the field being read
+        self.assertEqual(validateForm(body[:-20], self.schema, content_type), (False, None, ['bio']))
+
+        self.assertRaises(ValueError, validateForm, body, self.schema, 'multipart/form-data')
+        self.assertRaises(ValueError, validateForm, body, self.schema, 'text/plain')
+
+
+class TestIncremental(unittest.TestCase):
+
+    def testIncrementalText(self):
+        import random
+        from gae_validators.incremental import IncrementalText
+
+        # random edits with lots of whitespace should always match validating the whole text
+        randomizer = random.Random(0)
+        alphabet = [u' ', u' ', u'a', u'b', u'\n', u'\t', u'\xa0', u'\u3000', u'\xe9']
+
+        def randomText(length):
+            return u''.join(randomizer.choice(alphabet) for i in range(length))
+
+        for chunk_size in (1, 3, 16):
+            for kwargs in ({}, {'newlines': False, 'max_length': 40}, {'condense': False, 'convert_spaces': False},
+                    {'encoding': 'ascii'}, {'encoding': 'cp1251'}):
+                source = randomText(100)
+                text = IncrementalText(source, chunk_size=chunk_size, **kwargs)
+                self.assertEqual(text.validate(), validateText(source, **kwargs))
+
+                for i in range(50):
+                    start = randomizer.randint(0, len(source))
+                    end = randomizer.randint(start, min(len(source), start + 10))
+                    new_text = randomText(randomizer.choice([0, 1, 5]))
+                    source = source[:start] + new_text + source[end:]
+                    self.assertEqual(text.edit(start, end, new_text), validateText(source, **kwargs))
+                    self.assertEqual(text.source, source)
+                    self.assertEqual(len(text), len(source))
+
+        # min_length matches the required version
+        text = IncrementalText(u'   ', min_length=1)
+        self.assertEqual(text.validate(), validateRequiredText(u'   '))
+        self.assertEqual(text.edit(1, 1, u'a'), (True, u'a'))
+        self.assertEqual(text.edit(0, 4, u''), validateRequiredText(u''))
+
+        self.assertRaises(ValueError, text.edit, 0, 1, u'a')
+        self.assertRaises(ValueError, text.edit, -1, 0, u'a')
+
+
+class TestBulk(unittest.TestCase):
+
+    SCHEMA = {'email': validateRequiredEmail, 'age': (validateInt, {'min_amount': 13})}
+
+    def validate(self, rows):
+        rejected = []
+        valid_rows = list(bulk.validateRows(rows, self.SCHEMA,
+            rejected=lambda number, row, errors: rejected.append((number, sorted(errors)))))
+        return valid_rows, rejected
+
+    def testCsv(self):
+        data = 'email,age\ntest@example.com,30\nbad,12\n,40\n'
+        # the python 2 csv module only works on byte strings
+        fileobj = io.StringIO(data) if PY3 else io.BytesIO(data)
+
+        valid_rows, rejected = self.validate(bulk.readCsv(fileobj))
+        self.assertEqual(valid_rows, [{'email': 'test@example.com', 'age': 30}])
+        self.assertEqual(rejected, [(2, ['age', 'email']), (3, ['email'])])
+
+    def testJsonl(self):
+        fileobj = io.StringIO(u'{"email": "test@example.com", "age": 30}\n\n[1, 2]\nnot json\n{"age": "12"}\n')
+
+        valid_rows, rejected = self.validate(bulk.readJsonl(fileobj))
+        self.assertEqual(valid_rows, [{'email': 'test@example.com', 'age': 30}])
+        self.assertEqual(rejected, [(2, ['row']), (3, ['row']), (4, ['age', 'email'])])
+
+    def testRowsAreLazy(self):
+        # rows should be pulled from the source one at a time rather than all up front
+        def rows():
+            i = 0
+            while True:
+                i += 1
+                yield {'email': 'test%d@example.com' % i, 'age': '20'}
+
+        results = bulk.validateRows(rows(), self.SCHEMA)
+        self.assertEqual(next(results)['email'], 'test1@example.com')
+        self.assertEqual(next(results)['email'], 'test2@example.com')
+
+
+@unittest.skipUnless(numpy, 'numpy is not installed')
+class TestColumns(unittest.TestCase):
+
+    def assertMatchesScalar(self, column_validator, validator, sources, **kwargs):
+        valid, values = column_validator(sources, **kwargs)
+        self.assertIsInstance(values, numpy.ma.MaskedArray)
+        self.assertEqual(len(valid), len(sources))
+        for i, source in enumerate(sources):
+            expected_valid, expected_value = validator(source, **kwargs)
+            self.assertEqual(bool(valid[i]), expected_valid, repr(source))
+            if expected_value is None:
+                self.assertTrue(values.mask[i], repr(source))
+            elif expected_valid:
+                self.assertFalse(values.mask[i], repr(source))
+                self.assertEqual(values[i], expected_value, repr(source))
+
+    def testValidateIntColumn(self):
+        from gae_validators.columns import validateIntColumn, validateRequiredIntColumn
+
+        sources = ['0', '5', '-5', '+7', '007', '', ' 3', '1.0', '--1', '1-', 'x', '123456789012345678',
+            '1234567890123456789', '9223372036854775807', '9223372036854775808', '-9223372036854775808',
+            u'\u0663', 'a\x00', '1\x00', None, 4, 4.5, True]
+        self.assertMatchesScalar(validateIntColumn, validateInt, sources)
+        self.assertMatchesScalar(validateIntColumn, validateInt, sources, min_amount=0, max_amount=10)
+        self.assertMatchesScalar(validateRequiredIntColumn, validateRequiredInt, sources)
+
+        # numpy string arrays take the same path as lists of strings
+        strings = [source for source in sources if isinstance(source, str)]
+        self.assertMatchesScalar(validateIntColumn, validateInt, numpy.array(strings))
+        self.assertMatchesScalar(validateRequiredIntColumn, validateRequiredInt, numpy.array(strings), min_amount=1)
+
+        valid, values = validateIntColumn(numpy.array(['1', '', 'x']))
+        self.assertEqual(valid.tolist(), [True, True, False])
+        self.assertEqual(values.mask.tolist(), [False, True, True])
+
+        # bounds have to fit in the array
+        self.assertRaises(ValueError, validateIntColumn, ['1'], max_amount=2 ** 64)
+
+        valid, values = validateIntColumn([])
+        self.assertEqual(len(valid), 0)
+
+    def testValidateFloatColumn(self):
+        from gae_validators.columns import validateFloatColumn, validateRequiredFloatColumn
+
+        sources = ['0', '0.0', '1.5', '-1.5', '.5', '5.', '+.1', '.', '-', '1.2.3', '0.1', '3.14159', '1e5',
+            'inf', '', '123456789012345', '1234567890123456', '0.000000000000001', '99999999999999.9',
+            None, 2, 2.5]
+        self.assertMatchesScalar(validateFloatColumn, validateFloat, sources)
+        self.assertMatchesScalar(validateFloatColumn, validateFloat, sources, min_amount=-1, max_amount=1)
+        self.assertMatchesScalar(validateRequiredFloatColumn, validateRequiredFloat, sources)
+
+        strings = [source for source in sources if isinstance(source, str)]
+        self.assertMatchesScalar(validateFloatColumn, validateFloat, numpy.array(strings))
+
+        # the parsed values should be exactly the same as float()
+        strings = ['%d.%03d' % (i, i * 7 % 1000) for i in range(1000)]
+        valid, values = validateFloatColumn(strings)
+        self.assertTrue(valid.all())
+        self.assertEqual(values.tolist(), [float(s) for s in strings])
+
+    def testValidateDateTimeColumn(self):
+        from gae_validators.columns import validateDateTimeColumn, validateRequiredDateTimeColumn
+
+        sources = ['2020-06-01T12:30', '2020-06-01T12:29', '2020-06-01T12:31', '2020-02-29T00:00', '2019-02-29T00:00',
+            '2020-13-01T00:00', '2020-06-01T24:00', '2020-06-01 12:30', '2020-6-01T12:30', '0000-01-01T00:00',
+            '2020-06-01T12:30 ', '', None]
+        now = datetime(2020, 6, 1, 12, 30)
+        self.assertMatchesScalar(validateDateTimeColumn, validateDateTime, sources)
+        self.assertMatchesScalar(validateDateTimeColumn, validateDateTime, sources, future_only=True, now=now)
+        self.assertMatchesScalar(validateDateTimeColumn, validateDateTime, sources, past_only=True, now=now)
+        self.assertMatchesScalar(validateRequiredDateTimeColumn, validateRequiredDateTime, sources)
+
+        # fractions of a second can be 1 to 6 digits
+        date_format = '%Y-%m-%dT%H:%M:%S.%fZ'
+        sources = ['2020-06-01T12:30:00.5Z', '2020-06-01T12:30:00.123456Z', '2020-06-01T12:30:00.Z',
+            '2020-06-01T12:30:60.0Z', '2020-06-01T12:30:00.1234567Z']
+        self.assertMatchesScalar(validateDateTimeColumn, validateDateTime, numpy.array(sources),
+            date_format=date_format)
+
+        valid, values = validateDateTimeColumn(sources[:2], date_format=date_format)
+        self.assertEqual(values.dtype, numpy.dtype('datetime64[us]'))
+        self.assertEqual(values.tolist(), [datetime(2020, 6, 1, 12, 30, 0, 500000),
+            datetime(2020, 6, 1, 12, 30, 0, 123456)])
+
+        # other formats go through the scalar validator
+        self.assertMatchesScalar(validateDateTimeColumn, validateDateTime, ['Jun 01 2020', 'Jux 01 2020'],
+            date_format='%b %d %Y')
+
+        self.assertRaises(AssertionError, validateDateTimeColumn, sources, future_only=True, past_only=True)
+
+    def testValidateDateColumn(self):
+        from gae_validators.columns import validateDateColumn, validateRequiredDateColumn
+
+        sources = ['2020-06-01', '2020-05-31', '2020-06-02', '1900-02-29', '2000-02-29', '2020-04-31', '2020-00-10',
+            '20200601', '2020-06-0x', '', None]
+        now = datetime(2020, 6, 1, 12, 30)
+        self.assertMatchesScalar(validateDateColumn, validateDate, sources)
+        self.assertMatchesScalar(validateDateColumn, validateDate, sources, future_only=True, now=now)
+        self.assertMatchesScalar(validateDateColumn, validateDate, sources, past_only=True, now=now)
+        self.assertMatchesScalar(validateRequiredDateColumn, validateRequiredDate, numpy.array(sources[:-1]))
+        self.assertMatchesScalar(validateDateColumn, validateDate, ['20200601', '2020131'], date_format='%Y%m%d')
+
+        valid, values = validateDateColumn(numpy.array(['2020-06-01', '']))
+        self.assertEqual(values.dtype, numpy.dtype('datetime64[D]'))
+        self.assertEqual(valid.tolist(), [True, True])
+        self.assertEqual(values.mask.tolist(), [False, True])
+
+
+@unittest.skipUnless(PY3, 'concurrent.futures is only available on Python 3')
+class TestParallel(unittest.TestCase):
+
+    def testValidateParallel(self):
+        from gae_validators.parallel import validateParallel
+
+        sources = [str(i) for i in range(-50, 50)] + ['', 'None']
+        expected = batch.validateInt(sources, min_amount=0)
+
+        # results should come back in input order and match the batch version
+        results = validateParallel(validateInt, sources, chunk_size=7, max_workers=2, min_amount=0)
+        self.assertEqual(results, expected)
+
+        # lazy iterables should work too
+        results = validateParallel(validateChoices, iter(['a', 'b', 'c']), chunk_size=2, max_workers=2,
+            choices=['a', 'c'])
+        self.assertEqual(results, (bytearray([1, 0, 1]), ['a', 'b', 'c']))
+
+        # and so should validators without a name, like a partial
+        from functools import partial
+        results = validateParallel(partial(validateInt, min_amount=0), sources, chunk_size=7, max_workers=2)
+        self.assertEqual(results, expected)
+
+
+@unittest.skipUnless(PY3, 'asyncio is only available on Python 3')
+class TestAsync(unittest.TestCase):
+
+    def testValidateAsync(self):
+        import asyncio
+        from gae_validators.aio import validateAsync
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self.addCleanup(loop.close)
+
+        # small inputs are handled inline and large ones in an executor, but the results are the same
+        results = loop.run_until_complete(asyncio.gather(
+            validateAsync(validateText, 'foo  bar'),
+            validateAsync(validateText, 'foo  bar', max_inline=2),
+            validateAsync(validateString, 'a' * 10, max_inline=2, max_length=5),
+            validateAsync(validateInt, 5)
+        ))
+        self.assertEqual(results, [(True, 'foo bar'), (True, 'foo bar'), (False, 'a' * 10), (True, 5)])
+
+        # exceptions should be raised when awaited rather than when called
+        future = validateAsync(validateDateTime, 'x', future_only=True, past_only=True)
+        self.assertRaises(AssertionError, loop.run_until_complete, future)
+
+
+class TestCache(unittest.TestCase):
+
+    def testMemoize(self):
+        from gae_validators.cache import memoize
+
+        cached = memoize(validateEmail, maxsize=2)
+        self.assertEqual(cached(' test@example.com '), validateEmail(' test@example.com '))
+        self.assertEqual(cached(' test@example.com '), (True, 'test@example.com'))
+        self.assertEqual(cached.cacheInfo(), (1, 1, 2, 1))
+
+        # the least recently used result should be evicted
+        cached('a@example.com')
+        cached(' test@example.com ')
+        cached('b@example.com')
+        self.assertEqual(cached.cacheInfo().currsize, 2)
+        cached(' test@example.com ')
+        self.assertEqual(cached.cacheInfo().hits, 3)
+        cached('a@example.com')
+        self.assertEqual(cached.cacheInfo().misses, 4)
+
+        cached.cacheClear()
+        self.assertEqual(cached.cacheInfo(), (0, 0, 2, 0))
+
+        if PY3:
+            # different types with equal values should be cached separately
+            cached = memoize(validateString)
+            self.assertEqual(cached(1.0), (True, '1.0'))
+            self.assertEqual(cached(1), (True, '1'))
+
+        # parameters should be part of the key, and unhashable ones skip the cache
+        cached = memoize(validateChoices)
+        self.assertTrue(cached('a', choices=('a', 'b'))[0])
+        self.assertFalse(cached('a', choices=('b', 'c'))[0])
+        self.assertTrue(cached('a', ['a'])[0])
+        self.assertEqual(cached.cacheInfo().currsize, 2)
+
+        # comparisons to the current time should never be cached
+        cached = memoize(validateDate)
+        cached('3000-01-20', future_only=True)
+        cached('3000-01-20', '%Y-%m-%d', False, True)
+        self.assertEqual(cached.cacheInfo().currsize, 0)
+        cached('3000-01-20')
+        self.assertEqual(cached.cacheInfo().currsize, 1)
+
+        # including when they're bound with a partial
+        from functools import partial
+        cached = memoize(partial(validateDate, future_only=True))
+        cached('3000-01-20')
+        cached('3000-01-20')
+        self.assertEqual(cached.cacheInfo(), (0, 0, 1024, 0))
+
+        # it should also work as a decorator
+        @memoize(maxsize=10)
+        def validateUpper(source):
+            return validateString(source.upper())
+
+        self.assertEqual(validateUpper('foo'), (True, 'FOO'))
+        self.assertEqual(validateUpper.__name__, 'validateUpper')
+
+
+class TestInstrument(unittest.TestCase):
+
+    def tearDown(self):
+        from gae_validators import instrument
+        instrument.disable()
+
+    def testMemorySink(self):
+        import gae_validators
+        from gae_validators import instrument
+
+        original = gae_validators.validateEmail
+        sink = instrument.enable(instrument.MemorySink())
+        self.assertTrue(instrument.isEnabled())
+        self.assertNotEqual(gae_validators.validateEmail, original)
+
+        # results should be unchanged
+        self.assertEqual(gae_validators.validateEmail('test@example.com'), (True, 'test@example.com'))
+        self.assertEqual(gae_validators.validateEmail('test@example.c'), (False, 'test@example.c'))
+        gae_validators.validateString('a' * 501)
+        gae_validators.validateString('a\nb')
+        gae_validators.validateInt('100', max_amount=10)
+
+        # validators called by other validators should be recorded too
+        stats = sink.snapshot()
+        self.assertEqual(stats['validateEmail']['calls'], 2)
+        self.assertEqual(stats['validateEmail']['invalid'], 1)
+        self.assertEqual(stats['validateString']['calls'], 4)
+        self.assertEqual(stats['validateString']['invalid'], 2)
+        self.assertEqual(sum(stats['validateEmail']['latency'].values()), 2)
+        self.assertEqual(stats['validateString']['sizes'][512], 1)
+
+        # with the reasons for each rejection
+        self.assertEqual(stats['validateEmail']['reasons'], {'bad TLD': 1})
+        self.assertEqual(stats['validateString']['reasons'], {'too long': 1, 'newline': 1})
+        self.assertEqual(stats['validateInt']['reasons'], {'out of range': 1})
+
+        # the batch validators should be recorded as well
+        batch.validateInt(['1', 'a'])
+        self.assertEqual(sink.snapshot()['validateInt']['reasons'], {'out of range': 1, 'not a number': 1})
+
+        sink.clear()
+        self.assertEqual(sink.snapshot(), {})
+
+        # disabling should restore the originals
+        instrument.disable()
+        self.assertFalse(instrument.isEnabled())
+        self.assertEqual(gae_validators.validateEmail, original)
+        gae_validators.validateEmail('test@example.c')
+        self.assertEqual(sink.snapshot(), {})
+
+    def testLoggingSink(self):
+        import logging
+        import gae_validators
+        from gae_validators import instrument
+
+        messages = []
+
+        class Handler(logging.Handler):
+            def emit(self, record):
+                messages.append(record.getMessage())
+
+        logger = logging.getLogger('test_instrument')
+        logger.addHandler(Handler())
+        logger.setLevel(logging.INFO)
+
+        instrument.enable(instrument.LoggingSink(logger, level=logging.INFO))
+        gae_validators.validateRequiredUrl('')
+
+        self.assertEqual(messages[0].split(' ')[:2], ['validateString', 'passed'])
+        self.assertEqual(messages[1].split(' ')[:2], ['validateUrl', 'passed'])
+        self.assertEqual(messages[2], 'validateRequiredUrl rejected: required')
+        self.assertEqual(messages[3].split(' ')[:2], ['validateRequiredUrl', 'failed'])
+
 
 if __name__ == '__main__':
     unittest.main()